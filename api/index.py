@@ -1,14 +1,26 @@
 import os
-from app import create_app
+import sys
+import importlib.util
 
 # Set instance path to handle read-only filesystems like Vercel
 os.environ.setdefault('INSTANCE_PATH', '/tmp/instance')
 
-# Create the Flask app
-app = create_app()
+# Register the app package lazily: it is only executed on first attribute
+# access, i.e. when the first request is dispatched
+_spec = importlib.util.find_spec('app')
+_spec.loader = importlib.util.LazyLoader(_spec.loader)
+_app_module = importlib.util.module_from_spec(_spec)
+sys.modules['app'] = _app_module
+_spec.loader.exec_module(_app_module)
+
+
+def app(environ, start_response):
+    """WSGI entry point; the Flask app is created (once) on first dispatch"""
+    return _app_module.create_app()(environ, start_response)
+
 
 # Vercel expects the application to be exported as 'app'
 application = app
 
 if __name__ == "__main__":
-    app.run()
\ No newline at end of file
+    _app_module.create_app().run()
@@ -1,18 +1,32 @@
-from flask import Flask
+import os
+from functools import lru_cache
+import click
+from flask import Flask, g, session
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from config import Config
+from app.lazy import LazyView
+from app.cache import init_cache
+from app.blocklist import init_blocklist
+from app.json_provider import ORJSONProvider
+from app.i18n import get_translator
 
-db = SQLAlchemy()
+# Objects stay loaded after commit: write endpoints serialize what they just
+# wrote, and the session is removed at the end of every request anyway
+db = SQLAlchemy(session_options={'expire_on_commit': False})
 jwt = JWTManager()
 
 
+@lru_cache(maxsize=1)
 def create_app(config_class=Config):
     """
     Application factory pattern for creating Flask app instances.
     This allows for flexible configuration and testing.
+    The app is memoized per config class so entry points that import it
+    (run.py, app.py, api/index.py) share one instance.
     """
     app = Flask(__name__)
+    app.json = ORJSONProvider(app)
     app.config.from_object(config_class)
     
     # Set instance path to handle read-only filesystems like Vercel
@@ -21,9 +35,31 @@ def create_app(config_class=Config):
     # Initialize extensions
     db.init_app(app)
     jwt.init_app(app)
+    init_cache(app)
+    init_blocklist(app, jwt)
     
     # Register blueprints
     register_blueprints(app)
+    if app.config.get('PRELOAD_VIEWS'):
+        preload_views(app)
+    
+    # Register CLI commands
+    register_commands(app)
+    
+    # Resolve the per-request translation function once from the session language
+    @app.before_request
+    def set_translator():
+        g.t = get_translator(session.get('language', 'en'))
+    
+    # Optionally pre-warm DB and statement caches before serving traffic
+    if app.config.get('WARMUP'):
+        from app.warmup import prewarm
+        prewarm(app)
+    
+    # Request bodies over MAX_CONTENT_LENGTH are rejected by Werkzeug
+    @app.errorhandler(413)
+    def request_too_large(e):
+        return {'error': f"Request too large. Maximum size: {app.config['MAX_CONTENT_LENGTH']} bytes"}, 413
     
     # Health check endpoint
     @app.route('/health')
@@ -33,26 +69,186 @@ def create_app(config_class=Config):
     return app
 
 
+# Bump when the schema changes so `flask init-db` runs again on deploy.
+SCHEMA_VERSION = 2
+
+
+def init_db(app, force=False):
+    """
+    Create database tables and the default admin user.
+    A sentinel file in the instance folder records that the current schema
+    version was initialized, so repeated runs are a no-op unless forced.
+    Returns True if the database was initialized.
+    """
+    sentinel = os.path.join(app.instance_path, f'.schema_v{SCHEMA_VERSION}')
+    if not force and os.path.exists(sentinel):
+        return False
+    
+    from app.models import Patient, User
+    from app.routes.auth import init_default_user
+    with app.app_context():
+        db.create_all()
+        upgrade_schema()
+        init_default_user()
+    
+    os.makedirs(app.instance_path, exist_ok=True)
+    with open(sentinel, 'w') as f:
+        f.write(str(SCHEMA_VERSION))
+    return True
+
+
+# Columns added since the first release: (table, column, column DDL).
+# create_all() only creates missing tables, so they are added by hand to
+# tables created by older versions.
+_ADDED_COLUMNS = (
+    ('patients', 'data_version', 'BIGINT NOT NULL DEFAULT 0'),
+    ('medical_documents', 'content_sha256', 'VARCHAR(64)'),
+)
+
+
+def upgrade_schema():
+    """
+    Bring tables created by an older version up to date: add the missing
+    columns listed in `_ADDED_COLUMNS`, then create the missing indexes.
+    Needs an app context; a no-op on an up-to-date database.
+    """
+    from sqlalchemy import inspect, text
+
+    inspector = inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    with db.engine.begin() as conn:
+        for table, column, ddl in _ADDED_COLUMNS:
+            if table in tables and column not in {c['name'] for c in inspector.get_columns(table)}:
+                conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+        for table in db.metadata.sorted_tables:
+            if table.name in tables:
+                for index in table.indexes:
+                    index.create(conn, checkfirst=True)
+
+
+def register_commands(app):
+    """Register Flask CLI commands."""
+    
+    @app.cli.command('init-db')
+    @click.option('--force', is_flag=True, help='Run even if the schema sentinel exists.')
+    def init_db_command(force):
+        """Create database tables and the default admin user."""
+        if init_db(app, force=force):
+            click.echo('Database initialized.')
+        else:
+            click.echo('Database already initialized; use --force to re-run.')
+
+
+# Route table: (blueprint name, url prefix, [(rule, view name, methods), ...]).
+# Views live in app.routes.<blueprint name> and are imported on first request.
+# This table is the only place routes are declared: the route modules hold
+# plain view functions, so a new view must be added here to be reachable.
+BLUEPRINT_ROUTES = [
+    ('auth', '/api/v1/auth', [
+        ('/login', 'login', ['POST']),
+        ('/logout', 'logout', ['POST']),
+        ('/refresh', 'refresh', ['POST']),
+        ('/change-password', 'change_password', ['POST']),
+        ('/session', 'get_session', ['GET']),
+        ('/session/<int:session_id>', 'delete_session', ['DELETE']),
+    ]),
+    ('patients', '/api/v1/patients', [
+        ('', 'get_patients', ['GET']),
+        ('/<int:patient_id>', 'get_patient', ['GET']),
+        ('', 'create_patient', ['POST']),
+        ('/<int:patient_id>', 'update_patient', ['PUT']),
+        ('/<int:patient_id>', 'patch_patient', ['PATCH']),
+        ('/<int:patient_id>', 'delete_patient', ['DELETE']),
+    ]),
+    ('reports', '/api/v1/reports', [
+        ('', 'get_reports', ['GET']),
+        ('/<int:report_id>', 'get_report', ['GET']),
+        ('', 'create_report', ['POST']),
+        ('/<int:report_id>', 'update_report', ['PUT']),
+        ('/<int:report_id>', 'delete_report', ['DELETE']),
+    ]),
+    ('observations', '/api/v1/observations', [
+        ('', 'get_observations', ['GET']),
+        ('/<int:observation_id>', 'get_observation', ['GET']),
+        ('', 'create_observation', ['POST']),
+        ('/<int:observation_id>', 'update_observation', ['PUT']),
+        ('/<int:observation_id>', 'delete_observation', ['DELETE']),
+    ]),
+    ('documents', '/api/v1/documents', [
+        ('/upload', 'upload_document', ['POST']),
+        ('/<int:document_id>/download', 'download_document', ['GET']),
+        ('/<int:document_id>/preview', 'preview_document', ['GET']),
+        ('/<int:document_id>', 'delete_document', ['DELETE']),
+        ('', 'get_documents', ['GET']),
+    ]),
+    ('fhir', '/fhir', [
+        ('/Patient', 'search_patients', ['GET']),
+        ('/Patient/<string:patient_id>', 'get_patient', ['GET']),
+        ('/Patient/<string:patient_id>', 'update_patient', ['PUT']),
+        ('/Patient/<string:patient_id>', 'patch_patient', ['PATCH']),
+        ('/Patient/<string:patient_id>', 'delete_patient', ['DELETE']),
+        ('/Patient', 'create_patient', ['POST']),
+        ('/Observation', 'search_observations', ['GET']),
+        ('/Observation/<string:observation_id>', 'get_observation', ['GET']),
+        ('/Observation', 'create_observation', ['POST']),
+        ('/Observation/<string:observation_id>', 'update_observation', ['PUT']),
+        ('/Observation/<string:observation_id>', 'delete_observation', ['DELETE']),
+        ('/DiagnosticReport', 'search_reports', ['GET']),
+        ('/DiagnosticReport/<string:report_id>', 'get_report', ['GET']),
+        ('/DiagnosticReport', 'create_report', ['POST']),
+        ('/DiagnosticReport/<string:report_id>', 'update_report', ['PUT']),
+        ('/DiagnosticReport/<string:report_id>', 'delete_report', ['DELETE']),
+        ('/Bundle', 'get_bundle', ['GET']),
+        ('/Bundle', 'post_bundle', ['POST']),
+    ]),
+    ('analytics', '/api/v1/analytics', [
+        ('/trends', 'get_trends', ['GET']),
+        ('/comparisons', 'get_comparisons', ['GET']),
+        ('/summary/<int:patient_id>', 'get_patient_summary', ['GET']),
+    ]),
+    ('backup', '/api/v1/backup', [
+        ('/create', 'create_backup', ['POST']),
+        ('/list', 'list_backups', ['GET']),
+        ('/restore', 'restore_backup', ['POST']),
+        ('/<backup_id>', 'delete_backup', ['DELETE']),
+    ]),
+    ('ai', '/api/v1/ai', [
+        ('/consult', 'get_consult_form', ['GET']),
+        ('/consult', 'ai_consult', ['POST']),
+        ('/consult/<job_id>', 'get_consult_job', ['GET']),
+        ('/providers', 'list_providers', ['GET']),
+    ]),
+    ('settings', '', [
+        ('/api/v1/settings/language', 'get_language', ['GET']),
+        ('/api/v1/settings/language', 'set_language', ['POST']),
+        ('/api/v1/translate/<key>', 'translate', ['GET']),
+    ]),
+]
+
+
 def register_blueprints(app):
-    """Register all blueprints with the Flask application."""
-    from app.routes.auth import bp as auth_bp
-    from app.routes.patients import bp as patients_bp
-    from app.routes.reports import bp as reports_bp
-    from app.routes.observations import bp as observations_bp
-    from app.routes.documents import bp as documents_bp
-    from app.routes.fhir import bp as fhir_bp
-    from app.routes.analytics import bp as analytics_bp
-    from app.routes.backup import bp as backup_bp
-    from app.routes.ai import bp as ai_bp
-    from app.routes.settings import bp as settings_bp
-    
-    app.register_blueprint(auth_bp)
-    app.register_blueprint(patients_bp)
-    app.register_blueprint(reports_bp)
-    app.register_blueprint(observations_bp)
-    app.register_blueprint(documents_bp)
-    app.register_blueprint(fhir_bp)
-    app.register_blueprint(analytics_bp)
-    app.register_blueprint(backup_bp)
-    app.register_blueprint(ai_bp)
-    app.register_blueprint(settings_bp)
\ No newline at end of file
+    """
+    Register all blueprint routes with the Flask application.
+    Each view is wrapped in a LazyView so the route module is only imported
+    when a request is first dispatched to it.
+    """
+    for name, url_prefix, routes in BLUEPRINT_ROUTES:
+        for rule, view_name, methods in routes:
+            app.add_url_rule(
+                url_prefix + rule,
+                endpoint=f'{name}.{view_name}',
+                view_func=LazyView(f'app.routes.{name}.{view_name}'),
+                methods=methods
+            )
+
+
+def preload_views(app):
+    """
+    Resolve every LazyView now, importing all route modules (and the models,
+    mappers and services they pull in) up front. Under a preforking server
+    that loads the app before forking, workers then inherit the imported
+    modules instead of each paying for them on its first requests.
+    """
+    for view_func in app.view_functions.values():
+        if isinstance(view_func, LazyView):
+            view_func.view
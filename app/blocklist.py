@@ -0,0 +1,51 @@
+import time
+from sqlalchemy import delete, exists
+from app.cache import get_redis
+
+# Key prefix for revoked token ids in Redis
+BLOCKLIST_PREFIX = 'jwt:bl:'
+
+
+def init_blocklist(app, jwt):
+    """
+    Register the revoked-token store with Flask-JWT-Extended.
+    Uses the shared Redis client when REDIS_URL is configured; otherwise
+    revocations are stored in the database. Either way they are shared by
+    all workers.
+    """
+
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        return is_token_revoked(jwt_payload['jti'])
+
+
+def revoke_token(jti, expires_at):
+    """
+    Revoke a token until its expiry time.
+
+    Args:
+        jti (str): Unique token identifier
+        expires_at (int): Token expiry as a Unix timestamp
+    """
+    redis = get_redis()
+    if redis is not None:
+        redis.setex(BLOCKLIST_PREFIX + jti, max(int(expires_at - time.time()), 1), 1)
+        return
+
+    from app import db
+    from app.models import RevokedToken
+    # Expired tokens are rejected anyway, so their entries are dropped here
+    db.session.execute(delete(RevokedToken).where(RevokedToken.expires_at < int(time.time())))
+    db.session.add(RevokedToken(jti=jti, expires_at=int(expires_at)))
+    db.session.commit()
+
+
+def is_token_revoked(jti):
+    """Check whether a token id has been revoked"""
+    redis = get_redis()
+    if redis is not None:
+        return bool(redis.exists(BLOCKLIST_PREFIX + jti))
+
+    from app import db
+    from app.models import RevokedToken
+    return db.session.query(exists().where(RevokedToken.jti == jti)).scalar()
@@ -0,0 +1,132 @@
+import hashlib
+from functools import wraps
+from flask import request, current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# TTL tiers (seconds) for cached responses
+TTL_SHORT = 30
+TTL_NORMAL = 300
+TTL_LONG = 3600
+
+_redis = None
+
+
+def init_cache(app):
+    """
+    Connect the shared Redis client when REDIS_URL is configured and hook
+    response-cache invalidation into session commits. Responses are only
+    cached in Redis: a per-process copy could not be invalidated by writes
+    handled in other workers.
+    """
+    global _redis
+    redis_url = app.config.get('REDIS_URL')
+    if redis_url:
+        import redis
+        _redis = redis.Redis.from_url(redis_url)
+
+    if not event.contains(Session, 'after_commit', _invalidate_committed_patients):
+        event.listen(Session, 'after_commit', _invalidate_committed_patients)
+        event.listen(Session, 'after_rollback', _discard_changed_patients)
+
+
+def get_redis():
+    """Get the shared Redis client, or None if Redis is not configured"""
+    return _redis
+
+
+def _redis_key(patient_id, key):
+    return f"resp:{patient_id}:{key}"
+
+
+def _redis_index(patient_id):
+    return f"resp:{patient_id}:keys"
+
+
+def get_cached_response(patient_id, key):
+    """Get a cached (body, etag) pair, or None; requires Redis"""
+    entry = _redis.hgetall(_redis_key(patient_id, key))
+    return (entry[b'body'], entry[b'etag'].decode()) if entry else None
+
+
+def set_cached_response(patient_id, key, body, etag, ttl):
+    """Cache a serialized response body and its ETag for `ttl` seconds; requires Redis"""
+    redis_key = _redis_key(patient_id, key)
+    with _redis.pipeline() as pipe:
+        pipe.hset(redis_key, mapping={'body': body, 'etag': etag})
+        pipe.expire(redis_key, ttl)
+        pipe.sadd(_redis_index(patient_id), redis_key)
+        pipe.expire(_redis_index(patient_id), TTL_LONG)
+        pipe.execute()
+
+
+def invalidate_patient(patient_id):
+    """Drop every cached response for a patient"""
+    if _redis is None:
+        return
+    index = _redis_index(patient_id)
+    keys = _redis.smembers(index)
+    _redis.delete(index, *keys)
+
+
+def clear_response_cache():
+    """Drop every cached response, e.g. after the whole database was replaced"""
+    if _redis is None:
+        return
+    keys = list(_redis.scan_iter('resp:*', count=1000))
+    for i in range(0, len(keys), 1000):
+        _redis.delete(*keys[i:i + 1000])
+
+
+def _invalidate_committed_patients(session):
+    from app.models import CHANGED_PATIENTS_KEY
+    for patient_id in session.info.pop(CHANGED_PATIENTS_KEY, ()):
+        if patient_id is not None:
+            invalidate_patient(patient_id)
+
+
+def _discard_changed_patients(session):
+    from app.models import CHANGED_PATIENTS_KEY
+    session.info.pop(CHANGED_PATIENTS_KEY, None)
+
+
+def cached_response(name, ttl=TTL_NORMAL, resolve_patient=None, mimetype='application/json'):
+    """
+    Cache a patient-scoped GET view's JSON body and ETag.
+    The patient comes from `resolve_patient(view_args)` if given, else from
+    the `patient_id` view argument or the `patient` query parameter; the
+    cache key also includes the path and query string. Hits are served (or
+    answered with 304) without running the view, and entries are dropped
+    whenever that patient's data is committed. Without Redis the view simply
+    runs on every request.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if _redis is None:
+                return view(*args, **kwargs)
+            
+            if resolve_patient is not None:
+                patient_id = resolve_patient(kwargs)
+            else:
+                patient_id = kwargs.get('patient_id') or request.args.get('patient', type=int)
+            if not patient_id:
+                return view(*args, **kwargs)
+
+            key = f"{name}:{request.full_path}"
+            cached = get_cached_response(patient_id, key)
+            if cached is not None:
+                body, etag = cached
+                response = current_app.response_class(body, mimetype=mimetype)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                body = response.get_data()
+                etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+                set_cached_response(patient_id, key, body, etag, ttl)
+
+            response.set_etag(etag)
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
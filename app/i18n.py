@@ -1,4 +1,7 @@
 # Internationalization module for Blood Work Tracker
+import sys
+from types import MappingProxyType
+
 translations = {
     'es': {
         'settings': 'Ajustes',
@@ -49,21 +52,60 @@ translations = {
 }
 
 
+# Flat, read-only "<lang>:<key>" view of the translations built once at import
+_FLAT_TRANSLATIONS = MappingProxyType({
+    sys.intern(f"{lang}:{key}"): text
+    for lang, texts in translations.items()
+    for key, text in texts.items()
+})
+
+
+def _make_translator(lang):
+    """
+    Build a get_text specialized for one language.
+    English fallbacks are merged into its table up front, so a lookup is a
+    single dict probe that falls back to the key itself.
+    """
+    table = MappingProxyType({**translations['en'], **translations.get(lang, {})})
+
+    def translate(key, _table=table):
+        return _table.get(key, key)
+
+    translate.__name__ = f"get_text_{lang}"
+    return translate
+
+
+get_text_en = _make_translator('en')
+get_text_es = _make_translator('es')
+
+_TRANSLATORS = MappingProxyType({'en': get_text_en, 'es': get_text_es})
+
+
+def get_translator(lang):
+    """
+    Get the specialized translation function for a language (English if unknown)
+    """
+    return _TRANSLATORS.get(lang, get_text_en)
+
+
 def get_text(key, lang='en'):
     """
     Get translated text based on key and language
     """
-    if lang not in translations:
-        lang = 'en'  # fallback to English
-    
-    return translations[lang].get(key, key)
+    # Fall back to English, then to the key itself
+    return _FLAT_TRANSLATIONS.get(f"{lang}:{key}") or _FLAT_TRANSLATIONS.get(f"en:{key}", key)
+
+
+# Built once; the language list does not change at runtime
+AVAILABLE_LANGUAGES = (
+    {'code': 'en', 'name': 'English'},
+    {'code': 'es', 'name': 'Español'}
+)
+LANGUAGE_CODES = frozenset(language['code'] for language in AVAILABLE_LANGUAGES)
 
 
 def get_available_languages():
     """
     Get list of available languages
     """
-    return [
-        {'code': 'en', 'name': 'English'},
-        {'code': 'es', 'name': 'Español'}
-    ]
\ No newline at end of file
+    return AVAILABLE_LANGUAGES
\ No newline at end of file
@@ -0,0 +1,63 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+from flask import current_app
+from app import db
+from app.cache import get_redis
+
+# Key prefix for job state in Redis
+JOB_PREFIX = 'job:'
+# Seconds a job's state (and result) is kept once submitted
+JOB_TTL = 3600
+
+# Background jobs run in this process; only their state is shared (in Redis)
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='job')
+
+
+def jobs_available():
+    """
+    Check whether background jobs can be offered: their state must be in
+    Redis so any worker can answer a poll, and the process must keep running
+    after the response (not so on serverless platforms)
+    """
+    return get_redis() is not None and not current_app.config.get('SERVERLESS')
+
+
+def _set_job(job_id, state):
+    get_redis().setex(JOB_PREFIX + job_id, JOB_TTL, orjson.dumps(state))
+
+
+def get_job(job_id):
+    """Get a job's state ({'status': 'pending'|'done'|'failed', ...}), or None if unknown, expired or jobs are unavailable"""
+    redis = get_redis()
+    if redis is None:
+        return None
+    state = redis.get(JOB_PREFIX + job_id)
+    return orjson.loads(state) if state else None
+
+
+def submit_job(func, *args):
+    """
+    Run func(*args) on a background thread inside an application context,
+    off the request thread. Only call when jobs_available(). Its (JSON-serializable) return value becomes the
+    job's 'result'; an exception marks the job 'failed'.
+
+    Returns:
+        str: Job id for get_job
+    """
+    app = current_app._get_current_object()
+    job_id = uuid.uuid4().hex
+    _set_job(job_id, {'status': 'pending'})
+
+    def run():
+        with app.app_context():
+            try:
+                _set_job(job_id, {'status': 'done', 'result': func(*args)})
+            except Exception as e:
+                app.logger.exception(f"Background job {job_id} failed")
+                _set_job(job_id, {'status': 'failed', 'error': str(e)})
+            finally:
+                db.session.remove()
+
+    _executor.submit(run)
+    return job_id
@@ -0,0 +1,79 @@
+from datetime import date
+from decimal import Decimal
+from flask import current_app
+from flask.json.provider import JSONProvider
+from werkzeug.http import http_date
+import orjson
+
+
+# Keep Flask's wire format: sorted keys, non-str keys allowed and datetimes
+# passed through to _default so they stay HTTP dates, as with the stdlib provider.
+# NumPy arrays are encoded natively, without converting them to lists first.
+ORJSON_OPTIONS = (
+    orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+    | orjson.OPT_SERIALIZE_NUMPY
+)
+
+
+def _default(obj):
+    """Serialize the types orjson leaves to us the same way Flask's default provider does"""
+    if isinstance(obj, date):
+        return http_date(obj)
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class ORJSONProvider(JSONProvider):
+    """JSON provider backed by orjson, used by jsonify and request.get_json"""
+
+    mimetype = 'application/json'
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS), mimetype=self.mimetype
+        )
+
+
+# Hot list endpoints emit rows in column order, which is already stable,
+# so they skip the key sort (the costliest part of encoding a large page)
+LIST_ORJSON_OPTIONS = ORJSON_OPTIONS & ~orjson.OPT_SORT_KEYS
+
+
+def json_response(obj, status=200):
+    """
+    Serialize a list payload in one orjson pass, bypassing jsonify's argument
+    handling and key sorting. Values are encoded as jsonify would encode them.
+    """
+    return current_app.response_class(
+        orjson.dumps(obj, default=_default, option=LIST_ORJSON_OPTIONS), status=status, mimetype='application/json'
+    )
+
+
+# FHIR resources carry ISO 8601 datetimes, so datetimes are left to orjson
+FHIR_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _fhir_default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_fhir(obj):
+    """Serialize a FHIR resource (or Bundle fragment) to JSON bytes"""
+    return orjson.dumps(obj, default=_fhir_default, option=FHIR_ORJSON_OPTIONS)
+
+
+def fhir_response(obj, status=200):
+    """Serialize a FHIR resource in one orjson pass and wrap it in an application/fhir+json response"""
+    return current_app.response_class(dumps_fhir(obj), status=status, mimetype='application/fhir+json')
@@ -0,0 +1,20 @@
+from werkzeug.utils import import_string, cached_property
+
+
+class LazyView:
+    """
+    View wrapper that imports the real view function on first call.
+    This keeps route modules (and their dependencies) out of app start-up
+    until a request is actually routed to them.
+    """
+
+    def __init__(self, import_name):
+        self.__module__, self.__name__ = import_name.rsplit('.', 1)
+        self.import_name = import_name
+
+    @cached_property
+    def view(self):
+        return import_string(self.import_name)
+
+    def __call__(self, *args, **kwargs):
+        return self.view(*args, **kwargs)
@@ -1,179 +1,439 @@
 from datetime import datetime, date
-from sqlalchemy import Column, Integer, String, Text, DateTime, Date, Float, ForeignKey, Boolean
-from sqlalchemy.orm import declarative_base, relationship
+from flask import current_app
+from typing import List, Optional
+from sqlalchemy import DDL, BigInteger, Integer, String, Text, Float, ForeignKey, Index, case, cast, delete, event, exists, extract, insert, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import Mapped, Session, mapped_column, raiseload, relationship
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.sql import func
 from app import db
-import uuid
+import os
+import sqlite3
+import sys
+
+
+@event.listens_for(Engine, 'connect')
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """SQLite only enforces foreign keys (and their ON DELETE actions) when enabled per connection"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
+# Variant digit (RFC 4122: 10xx) for each random hex digit
+_UUID4_VARIANT = {digit: '89ab'[int(digit, 16) & 3] for digit in '0123456789abcdef'}
+
+
+def _format_uuid4(h):
+    """Format 32 random hex chars as a canonical UUID4 string (version and variant bits set)"""
+    return f"{h[:8]}-{h[8:12]}-4{h[13:16]}-{_UUID4_VARIANT[h[16]]}{h[17:20]}-{h[20:32]}"
+
+
+def _fast_uuid4():
+    """Generate a UUID4 string straight from os.urandom, skipping the uuid.UUID object"""
+    return _format_uuid4(os.urandom(16).hex())
+
+
+def _fast_uuid4_batch(count):
+    """Generate `count` UUID4 strings from a single os.urandom call (bulk inserts)"""
+    h = os.urandom(16 * count).hex()
+    variant = _UUID4_VARIANT
+    # Formatted in place from the shared hex string: no per-row slice or call
+    return [
+        f"{h[i:i + 8]}-{h[i + 8:i + 12]}-4{h[i + 13:i + 16]}-{variant[h[i + 16]]}{h[i + 17:i + 20]}-{h[i + 20:i + 32]}"
+        for i in range(0, 32 * count, 32)
+    ]
+
+
+def _new_data_version():
+    """Random 62-bit token for Patient.data_version (fits a signed BIGINT)"""
+    return int.from_bytes(os.urandom(8), 'big') >> 2
 
 
 class Patient(db.Model):
     __tablename__ = 'patients'
-    id = Column(Integer, primary_key=True)
-    fhir_id = Column(String, unique=True)  # UUID4 for FHIR
-    name = Column(String, nullable=False)
-    birth_date = Column(Date)
-    gender = Column(String(10))
-    notes = Column(Text)
-    created_at = Column(DateTime, default=datetime.now)
-    updated_at = Column(DateTime)
+    __table_args__ = (
+        # Trigram index for substring name search (ILIKE '%x%'); PostgreSQL only
+        Index(
+            'ix_patients_name_trgm', 'name',
+            postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}
+        ).ddl_if(dialect='postgresql'),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    fhir_id: Mapped[Optional[str]] = mapped_column(unique=True, default=_fast_uuid4)  # UUID4 for FHIR
+    name: Mapped[str]
+    birth_date: Mapped[Optional[date]]
+    gender: Mapped[Optional[str]] = mapped_column(String(10))
+    notes: Mapped[Optional[str]] = mapped_column(Text)
+    # Set in Python (local time) so it works on databases created before the
+    # server default existed; the server default covers rows inserted by SQL
+    created_at: Mapped[Optional[datetime]] = mapped_column(default=datetime.now, server_default=func.now())
+    # Stamped by the database (now()) in every UPDATE of the row
+    updated_at: Mapped[Optional[datetime]] = mapped_column(onupdate=func.now())
+    # Replaced by a fresh random token in every commit that changes the
+    # patient or its reports and observations; keys caches of the patient's
+    # data across processes. Random rather than a counter, so versions are
+    # not reused after a backup is restored
+    data_version: Mapped[int] = mapped_column(BigInteger, default=_new_data_version, server_default='0')
     
     # Relaciones
-    reports = relationship("TestReport", back_populates="patient")
-    observations = relationship("Observation", back_populates="patient")
-    documents = relationship("MedicalDocument", back_populates="patient")
+    # Deleted with the patient by delete_patient_cascade (explicitly, since tables
+    # created by older versions have no ON DELETE CASCADE)
+    reports: Mapped[List["TestReport"]] = relationship(
+        back_populates="patient", cascade="all, delete-orphan", passive_deletes=True
+    )
+    observations: Mapped[List["Observation"]] = relationship(
+        back_populates="patient", cascade="all, delete-orphan", passive_deletes=True
+    )
+    documents: Mapped[List["MedicalDocument"]] = relationship(
+        back_populates="patient", cascade="all, delete-orphan", passive_deletes=True
+    )
+    
+    @hybrid_property
+    def age(self) -> Optional[int]:
+        """Age in whole years, or None without a birth date"""
+        if not self.birth_date:
+            return None
+        today = date.today()
+        return today.year - self.birth_date.year - ((today.month, today.day) < (self.birth_date.month, self.birth_date.day))
+    
+    @age.inplace.expression
+    @classmethod
+    def _age_expression(cls):
+        # Same arithmetic in SQL, so selecting Patient.age is computed by the
+        # database. Cast, as PostgreSQL's EXTRACT returns numeric (Decimal)
+        today = func.current_date()
+        birthday_pending = (
+            extract('month', today) * 100 + extract('day', today)
+            < extract('month', cls.birth_date) * 100 + extract('day', cls.birth_date)
+        )
+        return cast(
+            extract('year', today) - extract('year', cls.birth_date)
+            - case((birthday_pending, 1), else_=0),
+            Integer
+        )
+
 
-    def __init__(self, name, birth_date=None, gender=None, notes=None):
-        self.name = name
-        self.birth_date = birth_date
-        self.gender = gender
-        self.notes = notes
-        self.fhir_id = str(uuid.uuid4())
+# gin_trgm_ops (ix_patients_name_trgm) comes from the pg_trgm extension
+event.listen(
+    Patient.__table__, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
 
 
 class LOINCCode(db.Model):
     __tablename__ = 'loinc_codes'
-    id = Column(Integer, primary_key=True)
-    code = Column(String, unique=True, nullable=False)
-    display = Column(String, nullable=False)
-    system = Column(String, default="http://loinc.org")
-    component = Column(String)
-    property = Column(String)
-    time_aspect = Column(String)
-    system_analyzed = Column(String)
-    scale_type = Column(String)
-    biomarkers = relationship("Biomarker", back_populates="loinc")
+    id: Mapped[int] = mapped_column(primary_key=True)
+    code: Mapped[str] = mapped_column(unique=True)
+    display: Mapped[str]
+    system: Mapped[Optional[str]] = mapped_column(default="http://loinc.org")
+    component: Mapped[Optional[str]]
+    property: Mapped[Optional[str]]
+    time_aspect: Mapped[Optional[str]]
+    system_analyzed: Mapped[Optional[str]]
+    scale_type: Mapped[Optional[str]]
+    biomarkers: Mapped[List["Biomarker"]] = relationship(back_populates="loinc")
 
 
 class UCUMUnit(db.Model):
     __tablename__ = 'ucum_units'
-    id = Column(Integer, primary_key=True)
-    code = Column(String, unique=True, nullable=False)
-    display = Column(String, nullable=False)
-    system = Column(String, default="http://unitsofmeasure.org")
-    biomarkers = relationship("Biomarker", back_populates="unit")
+    id: Mapped[int] = mapped_column(primary_key=True)
+    code: Mapped[str] = mapped_column(unique=True)
+    display: Mapped[str]
+    system: Mapped[Optional[str]] = mapped_column(default="http://unitsofmeasure.org")
+    biomarkers: Mapped[List["Biomarker"]] = relationship(back_populates="unit")
 
 
 class Biomarker(db.Model):
     __tablename__ = 'biomarkers'
-    id = Column(Integer, primary_key=True)
-    name = Column(String, nullable=False)
-    loinc_code_id = Column(Integer, ForeignKey('loinc_codes.id'), nullable=True)
-    ucum_unit_id = Column(Integer, ForeignKey('ucum_units.id'), nullable=True)
-    default_ref_min = Column(Float)
-    default_ref_max = Column(Float)
-    loinc = relationship("LOINCCode", back_populates="biomarkers")
-    unit = relationship("UCUMUnit", back_populates="biomarkers")
+    __table_args__ = (
+        # LOINC code searches resolve the code, then seek its biomarkers
+        Index('ix_biomarkers_loinc_code', 'loinc_code_id'),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str]
+    loinc_code_id: Mapped[Optional[int]] = mapped_column(ForeignKey('loinc_codes.id'))
+    ucum_unit_id: Mapped[Optional[int]] = mapped_column(ForeignKey('ucum_units.id'))
+    default_ref_min: Mapped[Optional[float]] = mapped_column(Float)
+    default_ref_max: Mapped[Optional[float]] = mapped_column(Float)
+    loinc: Mapped[Optional["LOINCCode"]] = relationship(back_populates="biomarkers")
+    unit: Mapped[Optional["UCUMUnit"]] = relationship(back_populates="biomarkers")
+
+
+# Expression index so case-insensitive name lookups can use an index seek
+Index('ix_biomarkers_lower_name', func.lower(Biomarker.name))
 
 
 class TestReport(db.Model):
     __tablename__ = 'test_reports'
-    id = Column(Integer, primary_key=True)
-    fhir_id = Column(String, unique=True)
-    patient_id = Column(Integer, ForeignKey('patients.id'), nullable=False)
-    status = Column(String, default="final")
-    category = Column(String, default="laboratory")
-    effective_datetime = Column(DateTime, nullable=False)
-    issued = Column(DateTime, default=datetime.utcnow)
-    conclusion = Column(Text)
-    conclusion_code = Column(String)
-    patient = relationship("Patient", back_populates="reports")
-    observations = relationship("Observation", back_populates="report")
-    documents = relationship("MedicalDocument", back_populates="report")
-
-    def __init__(self, patient_id, effective_datetime, status="final", category="laboratory", 
-                 conclusion=None, conclusion_code=None):
-        self.patient_id = patient_id
-        self.effective_datetime = effective_datetime
-        self.status = status
-        self.category = category
-        self.conclusion = conclusion
-        self.conclusion_code = conclusion_code
-        self.fhir_id = str(uuid.uuid4())
+    __table_args__ = (
+        Index('ix_reports_patient_time', 'patient_id', 'effective_datetime'),
+        # Keyset pages across all patients
+        Index('ix_reports_time_id', 'effective_datetime', 'id'),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    fhir_id: Mapped[Optional[str]] = mapped_column(unique=True, default=_fast_uuid4)
+    patient_id: Mapped[int] = mapped_column(ForeignKey('patients.id', ondelete='CASCADE'))
+    status: Mapped[Optional[str]] = mapped_column(default="final")
+    category: Mapped[Optional[str]] = mapped_column(default="laboratory")
+    effective_datetime: Mapped[datetime]
+    issued: Mapped[Optional[datetime]] = mapped_column(default=datetime.utcnow, server_default=func.now())
+    conclusion: Mapped[Optional[str]] = mapped_column(Text)
+    conclusion_code: Mapped[Optional[str]]
+    patient: Mapped["Patient"] = relationship(back_populates="reports")
+    # Observations are deleted and documents unlinked by the database when a report is deleted
+    observations: Mapped[List["Observation"]] = relationship(
+        back_populates="report", cascade="all, delete-orphan", passive_deletes=True
+    )
+    documents: Mapped[List["MedicalDocument"]] = relationship(back_populates="report", passive_deletes=True)
 
 
 class Observation(db.Model):
     __tablename__ = 'observations'
-    id = Column(Integer, primary_key=True)
-    fhir_id = Column(String, unique=True)
-    patient_id = Column(Integer, ForeignKey('patients.id'), nullable=False)
-    report_id = Column(Integer, ForeignKey('test_reports.id'), nullable=False)
-    biomarker_id = Column(Integer, ForeignKey('biomarkers.id'), nullable=False)
-    status = Column(String, default="final")
-    category = Column(String, default="laboratory")
-    effective_datetime = Column(DateTime, nullable=False)
-    value = Column(Float, nullable=False)
-    unit = Column(String)
-    ref_min = Column(Float)
-    ref_max = Column(Float)
-    interpretation = Column(String)  # L=low, N=normal, H=high
-    notes = Column(Text)
-    performer = Column(String)  # Laboratory
-    specimen = Column(String)   # Sample type
-    method = Column(String)     # Analytical technique
-    patient = relationship("Patient", back_populates="observations")
-    report = relationship("TestReport", back_populates="observations")
-    biomarker = relationship("Biomarker")
-
-    def __init__(self, patient_id, report_id, biomarker_id, effective_datetime, value,
-                 status="final", category="laboratory", unit=None, ref_min=None, 
-                 ref_max=None, interpretation=None, notes=None, performer=None, 
-                 specimen=None, method=None):
-        self.patient_id = patient_id
-        self.report_id = report_id
-        self.biomarker_id = biomarker_id
-        self.effective_datetime = effective_datetime
-        self.value = value
-        self.status = status
-        self.category = category
-        self.unit = unit
-        self.ref_min = ref_min
-        self.ref_max = ref_max
-        self.interpretation = interpretation
-        self.notes = notes
-        self.performer = performer
-        self.specimen = specimen
-        self.method = method
-        self.fhir_id = str(uuid.uuid4())
+    __table_args__ = (
+        Index('ix_obs_patient_report', 'patient_id', 'report_id'),
+        Index('ix_obs_biomarker', 'biomarker_id'),
+        # ON DELETE CASCADE from test_reports looks observations up by report
+        Index('ix_obs_report', 'report_id'),
+        Index('ix_obs_patient_time', 'patient_id', 'effective_datetime', 'biomarker_id'),
+        # Date-range searches and keyset pages across all patients
+        Index('ix_obs_time_id', 'effective_datetime', 'id'),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    fhir_id: Mapped[Optional[str]] = mapped_column(unique=True, default=_fast_uuid4)
+    patient_id: Mapped[int] = mapped_column(ForeignKey('patients.id', ondelete='CASCADE'))
+    report_id: Mapped[int] = mapped_column(ForeignKey('test_reports.id', ondelete='CASCADE'))
+    biomarker_id: Mapped[int] = mapped_column(ForeignKey('biomarkers.id'))
+    status: Mapped[Optional[str]] = mapped_column(default="final")
+    category: Mapped[Optional[str]] = mapped_column(default="laboratory")
+    effective_datetime: Mapped[datetime]
+    value: Mapped[float] = mapped_column(Float)
+    unit: Mapped[Optional[str]]
+    ref_min: Mapped[Optional[float]] = mapped_column(Float)
+    ref_max: Mapped[Optional[float]] = mapped_column(Float)
+    interpretation: Mapped[Optional[str]]  # L=low, N=normal, H=high
+    notes: Mapped[Optional[str]] = mapped_column(Text)
+    performer: Mapped[Optional[str]]  # Laboratory
+    specimen: Mapped[Optional[str]]   # Sample type
+    method: Mapped[Optional[str]]     # Analytical technique
+    patient: Mapped["Patient"] = relationship(back_populates="observations")
+    report: Mapped["TestReport"] = relationship(back_populates="observations")
+    biomarker: Mapped["Biomarker"] = relationship()
 
 
 class MedicalDocument(db.Model):
     __tablename__ = 'medical_documents'
-    id = Column(Integer, primary_key=True)
-    fhir_id = Column(String, unique=True)
-    patient_id = Column(Integer, ForeignKey('patients.id'), nullable=False)
-    report_id = Column(Integer, ForeignKey('test_reports.id'), nullable=True)
-    filename = Column(String, nullable=False)
-    filepath = Column(String, nullable=False)
-    file_type = Column(String)  # pdf, jpg, png
-    file_size = Column(Integer)
-    upload_date = Column(DateTime, default=datetime.utcnow)
-    description = Column(Text)
-    patient = relationship("Patient", back_populates="documents")
-    report = relationship("TestReport", back_populates="documents")
-
-    def __init__(self, patient_id, filename, filepath, file_type, file_size, 
-                 report_id=None, description=None):
-        self.patient_id = patient_id
-        self.filename = filename
-        self.filepath = filepath
-        self.file_type = file_type
-        self.file_size = file_size
-        self.report_id = report_id
-        self.description = description
-        self.fhir_id = str(uuid.uuid4())
+    __table_args__ = (
+        Index('ix_documents_patient_sha256', 'patient_id', 'content_sha256'),
+        # ON DELETE SET NULL from test_reports and the report filter
+        Index('ix_documents_report', 'report_id'),
+    )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    fhir_id: Mapped[Optional[str]] = mapped_column(unique=True, default=_fast_uuid4)
+    patient_id: Mapped[int] = mapped_column(ForeignKey('patients.id', ondelete='CASCADE'))
+    report_id: Mapped[Optional[int]] = mapped_column(ForeignKey('test_reports.id', ondelete='SET NULL'))
+    filename: Mapped[str]
+    filepath: Mapped[str]
+    file_type: Mapped[Optional[str]]  # pdf, jpg, png
+    file_size: Mapped[Optional[int]]
+    content_sha256: Mapped[Optional[str]] = mapped_column(String(64))
+    upload_date: Mapped[Optional[datetime]] = mapped_column(default=datetime.utcnow, server_default=func.now())
+    description: Mapped[Optional[str]] = mapped_column(Text)
+    patient: Mapped["Patient"] = relationship(back_populates="documents")
+    report: Mapped[Optional["TestReport"]] = relationship(back_populates="documents")
+
+
+def _intern_loaded_strings(*attrs):
+    """
+    Build a 'load' listener that interns low-cardinality string columns, so
+    large result sets share one str object per distinct value.
+    """
+    def listener(target, context):
+        for attr in attrs:
+            value = target.__dict__.get(attr)
+            if value is not None:
+                set_committed_value(target, attr, sys.intern(value))
+    return listener
+
+
+event.listen(Observation, 'load', _intern_loaded_strings('status', 'category', 'interpretation', 'unit'))
+event.listen(TestReport, 'load', _intern_loaded_strings('status', 'category'))
+
+
+# session.info key collecting ids of patients whose clinical data changed in
+# the current transaction (consumed on commit to invalidate cached analytics)
+CHANGED_PATIENTS_KEY = 'changed_patient_ids'
+
+
+def _track_changed_patients(session, flush_context):
+    changed = session.info.setdefault(CHANGED_PATIENTS_KEY, set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Patient):
+            changed.add(obj.id)
+        elif isinstance(obj, (Observation, TestReport)):
+            changed.add(obj.patient_id)
+
+
+event.listen(Session, 'after_flush', _track_changed_patients)
+
+
+def _bump_data_versions(session):
+    # Flush first: commit only flushes after before_commit, and pending
+    # changes must be tracked before the versions are bumped
+    session.flush()
+    patient_ids = {patient_id for patient_id in session.info.get(CHANGED_PATIENTS_KEY, ()) if patient_id is not None}
+    if patient_ids:
+        # updated_at is kept: only the patient's own columns stamp it
+        session.execute(
+            update(Patient).where(Patient.id.in_(patient_ids)).values(
+                data_version=_new_data_version(), updated_at=Patient.updated_at
+            ),
+            execution_options={'synchronize_session': False}
+        )
+
+
+event.listen(Session, 'before_commit', _bump_data_versions)
+
+
+def mark_patients_changed(session, patient_ids):
+    """Record patients changed by statements that bypass the unit of work (bulk INSERT/UPDATE)"""
+    session.info.setdefault(CHANGED_PATIENTS_KEY, set()).update(patient_ids)
+
+
+def delete_patient_cascade(condition):
+    """
+    Delete the patient matching `condition` together with its documents,
+    observations and reports. The children are deleted explicitly, as tables
+    created by older versions have no ON DELETE CASCADE. The caller commits.
+    
+    Returns:
+        int: The deleted patient's id, or None if no patient matched
+    """
+    patient_id = db.session.execute(select(Patient.id).where(condition)).scalar()
+    if patient_id is None:
+        return None
+    
+    for model in (MedicalDocument, Observation, TestReport):
+        db.session.execute(delete(model).where(model.patient_id == patient_id))
+    db.session.execute(delete(Patient).where(Patient.id == patient_id))
+    mark_patients_changed(db.session, (patient_id,))
+    return patient_id
+
+
+def delete_report_cascade(report):
+    """
+    Delete `report` with its observations and unlink its documents, which
+    tables created by older versions do not do on their own (no ON DELETE
+    CASCADE / SET NULL). The caller commits.
+    """
+    db.session.execute(delete(Observation).where(Observation.report_id == report.id))
+    db.session.execute(
+        update(MedicalDocument).where(MedicalDocument.report_id == report.id).values(report_id=None)
+    )
+    db.session.delete(report)
+
+
+def load_options(*options):
+    """
+    Loader options for queries whose relationship loading is planned. In
+    debug mode any relationship that is not explicitly loaded raises if
+    accessing it would emit SQL, so N+1 regressions surface early.
+    """
+    if current_app.debug:
+        options += (raiseload('*', sql_only=True),)
+    return options
+
+
+def update_returning(model, record_id, values):
+    """
+    Update one patient-scoped row by primary key with a single
+    UPDATE ... RETURNING, without loading it first, and record its patient as
+    changed. The caller commits.
+    
+    Returns:
+        Row: The updated row's columns, or None if no row has that id
+    """
+    columns = model.__table__.c
+    if values:
+        statement = update(model).where(model.id == record_id).values(**values).returning(*columns)
+        row = db.session.execute(statement, execution_options={'synchronize_session': False}).first()
+    else:
+        row = db.session.execute(select(*columns).where(model.id == record_id)).first()
+    if row is not None and values:
+        mark_patients_changed(db.session, (row.id if model is Patient else row.patient_id,))
+    return row
+
+
+def is_foreign_key_violation(error):
+    """Check whether an IntegrityError was raised by a foreign key constraint"""
+    orig = error.orig
+    sqlstate = getattr(orig, 'pgcode', None) or getattr(orig, 'sqlstate', None)
+    return sqlstate == '23503' or 'FOREIGN KEY constraint failed' in str(orig)
+
+
+def record_exists(model, record_id):
+    """Check whether a row with this primary key exists, without loading it or its eager collections"""
+    return db.session.query(exists().where(model.id == record_id)).scalar()
+
+
+def has_at_least(model, count):
+    """Check whether a table holds at least `count` rows, reading no further than the count-th"""
+    if count <= 0:
+        return True
+    return db.session.query(model.id).offset(count - 1).limit(1).scalar() is not None
+
+
+def bulk_insert_rows(model, rows):
+    """
+    Insert many rows of a model with a fhir_id with a single executemany
+    INSERT on its table, bypassing the ORM unit of work and per-instance
+    construction. `rows` are dicts of column values sharing the same keys;
+    fhir_ids that are not provided are generated in one batch. The caller
+    commits the session.
+    
+    Returns:
+        list: The inserted rows, fhir_ids filled in
+    """
+    if not rows:
+        return []
+    
+    rows = [dict(row) for row in rows]
+    missing = [row for row in rows if not row.get('fhir_id')]
+    for row, fhir_id in zip(missing, _fast_uuid4_batch(len(missing))):
+        row['fhir_id'] = fhir_id
+    
+    db.session.execute(insert(model.__table__), rows)
+    return rows
+
+
+def bulk_insert_observations(rows):
+    """
+    Insert many observations with a single executemany INSERT (see
+    bulk_insert_rows) and record their patients as changed.
+    
+    Returns:
+        int: Number of rows inserted
+    """
+    rows = bulk_insert_rows(Observation, rows)
+    mark_patients_changed(db.session, (row['patient_id'] for row in rows))
+    return len(rows)
 
 
 class User(db.Model):
     __tablename__ = 'users'
-    id = Column(Integer, primary_key=True)
-    username = Column(String, unique=True, nullable=False)
-    password_hash = Column(String, nullable=False)
-    email = Column(String, unique=True)
-    role = Column(String, default="user")  # admin, user
-    created_at = Column(DateTime, default=datetime.now)
-    last_login = Column(DateTime)
-
-    def __init__(self, username, password_hash, email=None, role="user"):
-        self.username = username
-        self.password_hash = password_hash
-        self.email = email
-        self.role = role
\ No newline at end of file
+    id: Mapped[int] = mapped_column(primary_key=True)
+    username: Mapped[str] = mapped_column(unique=True)
+    password_hash: Mapped[str]
+    email: Mapped[Optional[str]] = mapped_column(unique=True)
+    role: Mapped[Optional[str]] = mapped_column(default="user")  # admin, user
+    created_at: Mapped[Optional[datetime]] = mapped_column(default=datetime.now, server_default=func.now())
+    last_login: Mapped[Optional[datetime]]
+
+
+class RevokedToken(db.Model):
+    """Revoked JWT ids; the shared blocklist when no Redis is configured"""
+    __tablename__ = 'revoked_tokens'
+    jti: Mapped[str] = mapped_column(String(36), primary_key=True)
+    expires_at: Mapped[int] = mapped_column(BigInteger, index=True)  # token expiry (Unix timestamp)
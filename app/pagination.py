@@ -0,0 +1,67 @@
+import base64
+from datetime import datetime
+import orjson
+from sqlalchemy import tuple_
+
+
+def encode_cursor(values):
+    """Encode a row's sort-key values as an opaque URL-safe cursor"""
+    return base64.urlsafe_b64encode(orjson.dumps(values)).rstrip(b'=').decode()
+
+
+def decode_cursor(cursor, columns):
+    """
+    Decode a cursor back into sort-key values for the given columns.
+    Raises ValueError if the cursor is malformed.
+    """
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError('Invalid cursor') from e
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError('Invalid cursor')
+    return [
+        datetime.fromisoformat(value) if column.type.python_type is datetime else value
+        for column, value in zip(columns, values)
+    ]
+
+
+def requested_fields(fields, allowed, required=('id',)):
+    """
+    Parse a comma-separated `fields` parameter (a partial-response projection
+    like FHIR's _elements) into the field names to return, `required` ones
+    first. Returns None when no projection is requested.
+    Raises ValueError for fields not in `allowed`.
+    """
+    names = [name.strip() for name in (fields or '').split(',') if name.strip()]
+    if not names:
+        return None
+    unknown = sorted(set(names).difference(allowed))
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return list(dict.fromkeys((*required, *names)))
+
+
+def keyset_page(query, columns, cursor=None, count=20):
+    """
+    Fetch one page of `query` ordered by `columns` descending, starting after
+    `cursor`. The last column must be unique (normally the primary key).
+    Seeks past the previous page through the index instead of using OFFSET,
+    and fetches one extra row to know whether a next page exists, so no
+    COUNT(*) is issued.
+
+    Returns:
+        tuple: (items, next_cursor), next_cursor being None on the last page
+    """
+    if cursor:
+        query = query.filter(
+            tuple_(*columns) < tuple_(*decode_cursor(cursor, columns), types=[column.type for column in columns])
+        )
+    rows = query.order_by(*(column.desc() for column in columns)).limit(count + 1).all()
+
+    items = rows[:count]
+    next_cursor = None
+    if len(rows) > count:
+        last = items[-1]
+        next_cursor = encode_cursor([getattr(last, column.key) for column in columns])
+    return items, next_cursor
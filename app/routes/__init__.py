@@ -0,0 +1,6 @@
+"""
+View functions, one module per API area. Routes are not declared here with
+Blueprint decorators: they are listed in app.BLUEPRINT_ROUTES, which
+registers each view lazily (LazyView) so a module is only imported once a
+request is routed to it.
+"""
@@ -0,0 +1,29 @@
+from flask import request, jsonify
+from app import db
+from app.models import update_returning
+
+
+def update_resource(model, record_id, update_cls, response_cls, name):
+    """
+    Shared PUT/PATCH handler: validate the request body against `update_cls`,
+    apply the fields it sets with one UPDATE ... RETURNING and serialize the
+    updated row with `response_cls`. A body that sets no fields only reads the
+    current row and commits nothing.
+
+    Returns:
+        tuple: (response, status) - 404 if no row has that id, 400 if the body is invalid
+    """
+    try:
+        values = update_cls.model_validate_json(request.get_data()).model_dump(exclude_unset=True)
+
+        row = update_returning(model, record_id, values)
+        if row is None:
+            return jsonify({'error': f'{name} not found'}), 404
+
+        if values:
+            db.session.commit()
+
+        return jsonify(response_cls.from_orm(row).dict()), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
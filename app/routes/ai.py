@@ -1,15 +1,12 @@
-from flask import Blueprint, request, jsonify
+from flask import request, jsonify, current_app, stream_with_context
 from flask_jwt_extended import jwt_required
-from app.services.ai_provider import get_ai_provider, generate_fhir_context
 from app.schemas import AIConsultRequest, AIConsultResponse
 from app import db
+from app.jobs import get_job, jobs_available, submit_job
 from datetime import datetime
 from config import Config
 
-bp = Blueprint('ai', __name__, url_prefix='/api/v1/ai')
 
-
-@bp.route('/consult', methods=['GET'])
 @jwt_required()
 def get_consult_form():
     """Return the AI consultation form/UI"""
@@ -27,13 +24,22 @@ def get_consult_form():
     }), 200
 
 
-@bp.route('/consult', methods=['POST'])
+def _event_stream(chunks):
+    """Frame response chunks as server-sent events, ending with a 'done' event"""
+    for chunk in chunks:
+        yield ''.join(f"data: {line}\n" for line in chunk.split('\n')) + '\n'
+    yield 'event: done\ndata: \n\n'
+
+
 @jwt_required()
 def ai_consult():
     """Handle AI consultation request"""
+    # Imported here so requests that never consult the AI skip loading the providers
+    from app.services.ai_provider import get_ai_provider
+    
     try:
         data = request.get_json()
-        ai_request = AIConsultRequest(**data)
+        ai_request = AIConsultRequest.model_validate(data)
         
         # Determine which provider to use based on configuration and request
         provider_name = ai_request.provider
@@ -44,13 +50,8 @@ def ai_consult():
             else:
                 provider_name = 'mock'  # fallback
         
-        # Prepare context based on context_type
-        context = {}
         patient_id = data.get('patient_id')  # Expect patient_id in the request
         
-        if patient_id:
-            context = generate_fhir_context(patient_id)
-        
         # Check if sending to cloud is enabled
         if provider_name == 'openai' and not Config.AI_SEND_TO_CLOUD:
             return jsonify({
@@ -70,14 +71,20 @@ def ai_consult():
         
         provider = get_ai_provider(provider_name, **provider_kwargs)
         
-        # Generate response based on context type
-        prompt = ai_request.question
-        if ai_request.context_type == 'fhir_bundle':
-            prompt += f"\n\nDatos del paciente: {context.get('fhir_bundle', {})}"
-        elif ai_request.context_type == 'text_summary':
-            prompt += f"\n\nResumen de datos: {context.get('text_summary', '')}"
-        elif ai_request.context_type == 'raw_data':
-            prompt += f"\n\nDatos sin procesar: {context}"
+        if ai_request.background and jobs_available():
+            # Build the context and wait for the model on a background thread;
+            # the result is polled from GET /consult/<job_id>. Without Redis
+            # (or on serverless) the consultation is answered inline instead
+            job_id = submit_job(_run_consult, provider, ai_request, patient_id)
+            return jsonify({'job_id': job_id, 'status': 'pending'}), 202
+        
+        prompt, context = _consult_prompt(ai_request, patient_id)
+        
+        if ai_request.stream:
+            return current_app.response_class(
+                stream_with_context(_event_stream(provider.stream_response(prompt, context))),
+                mimetype='text/event-stream'
+            )
         
         response = provider.generate_response(prompt, context)
         
@@ -88,13 +95,53 @@ def ai_consult():
             timestamp=datetime.now()
         )
         
-        return jsonify(ai_response.dict()), 200
+        return current_app.response_class(ai_response.model_dump_json(), mimetype='application/json'), 200
     
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
 
-@bp.route('/providers', methods=['GET'])
+@jwt_required()
+def get_consult_job(job_id):
+    """Get the state of a background consultation, with its result once done"""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'job_id': job_id, **job}), 200
+
+
+def _consult_prompt(ai_request, patient_id):
+    """Build the prompt for a consultation and the patient context it embeds"""
+    from app.services.ai_provider import generate_fhir_context
+    
+    # Prepare context based on context_type
+    context = {}
+    if patient_id:
+        context = generate_fhir_context(patient_id)
+    
+    # Generate response based on context type
+    prompt = ai_request.question
+    if ai_request.context_type == 'fhir_bundle':
+        prompt += "\n\nDatos del paciente: " + context.get('fhir_bundle_json', '{}')
+    elif ai_request.context_type == 'text_summary':
+        prompt += f"\n\nResumen de datos: {context.get('text_summary', '')}"
+    elif ai_request.context_type == 'raw_data':
+        raw_context = {k: v for k, v in context.items() if k != 'fhir_bundle_json'}
+        prompt += f"\n\nDatos sin procesar: {raw_context}"
+    
+    return prompt, context
+
+
+def _run_consult(provider, ai_request, patient_id):
+    """Background job body: answer a consultation as a JSON-ready dict"""
+    prompt, context = _consult_prompt(ai_request, patient_id)
+    return AIConsultResponse(
+        response=provider.generate_response(prompt, context),
+        provider_used=provider.get_name(),
+        timestamp=datetime.now()
+    ).model_dump(mode='json')
+
+
 @jwt_required()
 def list_providers():
     """List available AI providers"""
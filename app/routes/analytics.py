@@ -1,17 +1,19 @@
-from flask import Blueprint, request, jsonify
+from flask import request, jsonify
 from flask_jwt_extended import jwt_required
-from app.models import Patient, Observation, Biomarker, LOINCCode
+from sqlalchemy import lambda_stmt, select
+from sqlalchemy.orm import joinedload, selectinload
+from app.models import Patient, Observation, Biomarker, LOINCCode, TestReport, record_exists
 from app.schemas import TrendQuery, TrendResponse, TrendDataPoint
 from app import db
+from app.cache import cached_response, TTL_NORMAL
 from datetime import datetime, timedelta
 from typing import Dict, List
 import calendar
+import numpy as np
 
-bp = Blueprint('analytics', __name__, url_prefix='/api/v1/analytics')
 
-
-@bp.route('/trends', methods=['GET'])
 @jwt_required()
+@cached_response('trends', ttl=TTL_NORMAL)
 def get_trends():
     """Get trend data for a specific biomarker over time for a patient"""
     try:
@@ -24,21 +26,18 @@ def get_trends():
             return jsonify({'error': 'Patient ID and biomarker code are required'}), 400
         
         # Validate patient exists
-        patient = Patient.query.get_or_404(patient_id)
+        if not record_exists(Patient, patient_id):
+            return jsonify({'error': 'Patient not found'}), 404
         
         # Find biomarker by LOINC code or name
-        # First try to find by LOINC code
-        loinc_code = LOINCCode.query.filter_by(code=biomarker_code).first()
-        biomarker = None
-        
-        if loinc_code:
-            biomarker = Biomarker.query.filter_by(loinc_code_id=loinc_code.id).first()
-        
-        # If not found by LOINC, try by biomarker name
-        if not biomarker:
-            biomarker = Biomarker.query.filter(
-                db.func.lower(Biomarker.name) == db.func.lower(biomarker_code)
-            ).first()
+        # Match by LOINC code or (case-insensitive) name in one query,
+        # preferring the LOINC match; unit is loaded in the same query
+        loinc_match = LOINCCode.code == biomarker_code
+        biomarker = Biomarker.query.options(joinedload(Biomarker.unit)).outerjoin(
+            Biomarker.loinc
+        ).filter(
+            db.or_(loinc_match, db.func.lower(Biomarker.name) == biomarker_code.lower())
+        ).order_by(db.case((loinc_match, 0), else_=1)).first()
         
         if not biomarker:
             return jsonify({'error': 'Biomarker not found'}), 404
@@ -57,9 +56,13 @@ def get_trends():
             start_date = end_date - timedelta(days=365)
         elif period == 'all':
             # Use the earliest observation date
-            earliest_obs = db.session.query(
-                db.func.min(Observation.effective_datetime)
-            ).filter_by(biomarker_id=biomarker.id, patient_id=patient_id).scalar()
+            biomarker_id = biomarker.id
+            earliest_obs = db.session.scalar(lambda_stmt(
+                lambda: select(db.func.min(Observation.effective_datetime)).where(
+                    Observation.biomarker_id == biomarker_id,
+                    Observation.patient_id == patient_id
+                )
+            ))
             if earliest_obs:
                 start_date = earliest_obs
             else:
@@ -68,24 +71,20 @@ def get_trends():
             return jsonify({'error': 'Invalid period. Use: 1m, 3m, 6m, 1y, all'}), 400
         
         # Query observations for this biomarker and patient within the date range
-        observations = Observation.query.filter(
-            Observation.biomarker_id == biomarker.id,
-            Observation.patient_id == patient_id,
-            Observation.effective_datetime >= start_date,
-            Observation.effective_datetime <= end_date
-        ).order_by(Observation.effective_datetime.asc()).all()
+        rows = _trend_rows(biomarker.id, patient_id, start_date, end_date)
         
-        # Convert observations to trend data points
-        data_points = []
-        for obs in observations:
-            data_points.append(TrendDataPoint(
-                date=obs.effective_datetime,
-                value=obs.value,
-                unit=obs.unit,
-                ref_min=obs.ref_min,
-                ref_max=obs.ref_max,
-                interpretation=obs.interpretation
-            ))
+        if request.args.get('format') == 'columns':
+            # Columnar series (parallel arrays) for long trends
+            return jsonify(_trend_columns(biomarker, rows)), 200
+        
+        # Convert rows to trend data points (values come typed from the DB)
+        data_points = [
+            TrendDataPoint.model_construct(
+                date=date, value=value, unit=unit,
+                ref_min=ref_min, ref_max=ref_max, interpretation=interpretation
+            )
+            for date, value, unit, ref_min, ref_max, interpretation in rows
+        ]
         
         # Create response
         trend_response = TrendResponse(
@@ -100,7 +99,6 @@ def get_trends():
         return jsonify({'error': str(e)}), 400
 
 
-@bp.route('/comparisons', methods=['GET'])
 @jwt_required()
 def get_comparisons():
     """Compare observations between different reports or time periods"""
@@ -112,48 +110,48 @@ def get_comparisons():
     
     try:
         # Validate patient exists
-        patient = Patient.query.get_or_404(patient_id)
+        if not record_exists(Patient, patient_id):
+            return jsonify({'error': 'Patient not found'}), 404
         
         if baseline_report_id:
             # Compare specific report with others
-            baseline_report = TestReport.query.filter_by(
+            baseline_report = TestReport.query.options(
+                selectinload(TestReport.observations).selectinload(Observation.biomarker)
+            ).filter_by(
                 id=baseline_report_id, 
                 patient_id=patient_id
             ).first_or_404()
             
             # Get observations from baseline report
-            baseline_obs = Observation.query.filter_by(
-                report_id=baseline_report_id
-            ).all()
+            baseline_obs = baseline_report.observations
             
-            # Get other recent reports for comparison
-            other_reports = TestReport.query.filter(
+            # Get other recent reports for comparison, with their observations
+            other_reports = TestReport.query.options(
+                selectinload(TestReport.observations)
+            ).filter(
                 TestReport.patient_id == patient_id,
                 TestReport.id != baseline_report_id
             ).order_by(TestReport.effective_datetime.desc()).limit(5).all()
             
             comparisons = []
             for report in other_reports:
-                report_obs = Observation.query.filter_by(
-                    report_id=report.id
-                ).all()
+                report_by_biomarker = _first_by_biomarker(report.observations)
                 
                 # Match observations by biomarker
                 matched_obs = []
                 for baseline_o in baseline_obs:
-                    for report_o in report_obs:
-                        if baseline_o.biomarker_id == report_o.biomarker_id:
-                            matched_obs.append({
-                                'biomarker': baseline_o.biomarker.name,
-                                'baseline_value': baseline_o.value,
-                                'baseline_unit': baseline_o.unit,
-                                'comparison_value': report_o.value,
-                                'comparison_unit': report_o.unit,
-                                'difference': report_o.value - baseline_o.value,
-                                'baseline_date': baseline_o.effective_datetime.isoformat(),
-                                'comparison_date': report_o.effective_datetime.isoformat()
-                            })
-                            break
+                    report_o = report_by_biomarker.get(baseline_o.biomarker_id)
+                    if report_o is not None:
+                        matched_obs.append({
+                            'biomarker': baseline_o.biomarker.name,
+                            'baseline_value': baseline_o.value,
+                            'baseline_unit': baseline_o.unit,
+                            'comparison_value': report_o.value,
+                            'comparison_unit': report_o.unit,
+                            'difference': report_o.value - baseline_o.value,
+                            'baseline_date': baseline_o.effective_datetime.isoformat(),
+                            'comparison_date': report_o.effective_datetime.isoformat()
+                        })
                 
                 if matched_obs:
                     comparisons.append({
@@ -169,7 +167,9 @@ def get_comparisons():
             }), 200
         else:
             # Compare latest report with previous one
-            reports = TestReport.query.filter_by(
+            reports = TestReport.query.options(
+                selectinload(TestReport.observations).selectinload(Observation.biomarker)
+            ).filter_by(
                 patient_id=patient_id
             ).order_by(TestReport.effective_datetime.desc()).limit(2).all()
             
@@ -179,31 +179,25 @@ def get_comparisons():
             latest_report, previous_report = reports[0], reports[1]
             
             # Get observations from both reports
-            latest_obs = Observation.query.filter_by(
-                report_id=latest_report.id
-            ).all()
-            
-            previous_obs = Observation.query.filter_by(
-                report_id=previous_report.id
-            ).all()
+            latest_obs = latest_report.observations
+            previous_by_biomarker = _first_by_biomarker(previous_report.observations)
             
             # Match observations by biomarker
             comparisons = []
             for latest_o in latest_obs:
-                for previous_o in previous_obs:
-                    if latest_o.biomarker_id == previous_o.biomarker_id:
-                        comparisons.append({
-                            'biomarker': latest_o.biomarker.name,
-                            'previous_value': previous_o.value,
-                            'previous_unit': previous_o.unit,
-                            'latest_value': latest_o.value,
-                            'latest_unit': latest_o.unit,
-                            'difference': latest_o.value - previous_o.value,
-                            'previous_date': previous_o.effective_datetime.isoformat(),
-                            'latest_date': latest_o.effective_datetime.isoformat(),
-                            'change_direction': 'increase' if latest_o.value > previous_o.value else 'decrease' if latest_o.value < previous_o.value else 'same'
-                        })
-                        break
+                previous_o = previous_by_biomarker.get(latest_o.biomarker_id)
+                if previous_o is not None:
+                    comparisons.append({
+                        'biomarker': latest_o.biomarker.name,
+                        'previous_value': previous_o.value,
+                        'previous_unit': previous_o.unit,
+                        'latest_value': latest_o.value,
+                        'latest_unit': latest_o.unit,
+                        'difference': latest_o.value - previous_o.value,
+                        'previous_date': previous_o.effective_datetime.isoformat(),
+                        'latest_date': latest_o.effective_datetime.isoformat(),
+                        'change_direction': 'increase' if latest_o.value > previous_o.value else 'decrease' if latest_o.value < previous_o.value else 'same'
+                    })
             
             return jsonify({
                 'latest_report_id': latest_report.id,
@@ -217,40 +211,26 @@ def get_comparisons():
         return jsonify({'error': str(e)}), 400
 
 
-@bp.route('/summary/<int:patient_id>', methods=['GET'])
 @jwt_required()
+@cached_response('summary', ttl=TTL_NORMAL)
 def get_patient_summary(patient_id):
     """Get a comprehensive summary of patient's analytics"""
-    patient = Patient.query.get_or_404(patient_id)
-    
-    # Count total reports
-    total_reports = TestReport.query.filter_by(patient_id=patient_id).count()
-    
-    # Count total observations
-    total_observations = Observation.query.filter_by(patient_id=patient_id).count()
+    # Only the fields the summary shows; age is computed by the database
+    patient = db.session.query(Patient.id, Patient.name, Patient.age).filter(
+        Patient.id == patient_id
+    ).first_or_404()
     
-    # Get biomarkers with abnormal values (outside reference range)
-    abnormal_obs = Observation.query.filter(
-        Observation.patient_id == patient_id,
-        db.or_(
-            Observation.value < Observation.ref_min,
-            Observation.value > Observation.ref_max
-        )
-    ).all()
+    # Count total reports and observations in one round trip
+    total_reports, total_observations = db.session.query(
+        db.select(db.func.count(TestReport.id)).where(TestReport.patient_id == patient_id).scalar_subquery(),
+        db.select(db.func.count(Observation.id)).where(Observation.patient_id == patient_id).scalar_subquery()
+    ).one()
     
-    # Group abnormal observations by biomarker
-    abnormal_biomarkers = {}
-    for obs in abnormal_obs:
-        biomarker_name = obs.biomarker.name
-        if biomarker_name not in abnormal_biomarkers:
-            abnormal_biomarkers[biomarker_name] = {
-                'count': 0,
-                'values': [],
-                'dates': []
-            }
-        abnormal_biomarkers[biomarker_name]['count'] += 1
-        abnormal_biomarkers[biomarker_name]['values'].append(obs.value)
-        abnormal_biomarkers[biomarker_name]['dates'].append(obs.effective_datetime.isoformat())
+    # Get biomarkers with abnormal values (outside reference range), grouped in SQL
+    abnormal_biomarkers = {
+        name: {'count': count, 'values': values, 'dates': dates}
+        for name, count, values, dates in _abnormal_biomarker_groups(patient_id)
+    }
     
     # Get most recent report
     latest_report = TestReport.query.filter_by(patient_id=patient_id)\
@@ -259,10 +239,18 @@ def get_patient_summary(patient_id):
     # Get observations from latest report
     latest_observations = []
     if latest_report:
-        latest_obs = Observation.query.filter_by(report_id=latest_report.id).all()
+        latest_obs = db.session.query(
+            Biomarker.name,
+            Observation.value,
+            Observation.unit,
+            Observation.ref_min,
+            Observation.ref_max,
+            Observation.interpretation,
+            Observation.effective_datetime
+        ).join(Observation.biomarker).filter(Observation.report_id == latest_report.id).all()
         for obs in latest_obs:
             latest_observations.append({
-                'biomarker': obs.biomarker.name,
+                'biomarker': obs.name,
                 'value': obs.value,
                 'unit': obs.unit,
                 'reference_range': f"{obs.ref_min} - {obs.ref_max}" if obs.ref_min and obs.ref_max else "N/A",
@@ -274,7 +262,7 @@ def get_patient_summary(patient_id):
         'patient': {
             'id': patient.id,
             'name': patient.name,
-            'age': calculate_age(patient.birth_date) if patient.birth_date else 'Unknown'
+            'age': patient.age if patient.age is not None else 'Unknown'
         },
         'analytics': {
             'total_reports': total_reports,
@@ -289,10 +277,88 @@ def get_patient_summary(patient_id):
     return jsonify(summary), 200
 
 
-def calculate_age(birth_date):
-    """Calculate age from birth date"""
-    if not birth_date:
-        return None
-    today = datetime.today()
-    age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
-    return age
\ No newline at end of file
+def _trend_columns(biomarker, rows):
+    """
+    Build a columnar trend payload: `t` holds Unix timestamps (seconds) and
+    `v` the values, as contiguous NumPy buffers the JSON provider encodes
+    directly; the remaining per-point fields are parallel lists.
+    """
+    dates, values, units, ref_mins, ref_maxs, interpretations = zip(*rows) if rows else ((),) * 6
+    timestamps = np.array(dates, dtype='datetime64[s]').astype(np.int64)
+    series = np.fromiter(values, dtype=np.float64, count=len(rows))
+    return {
+        'biomarker_name': biomarker.name,
+        'unit': biomarker.unit.display if biomarker.unit else None,
+        't': timestamps,
+        'v': series,
+        'units': list(units),
+        'ref_min': list(ref_mins),
+        'ref_max': list(ref_maxs),
+        'interpretation': list(interpretations)
+    }
+
+
+def _trend_rows(biomarker_id, patient_id, start_date, end_date):
+    """
+    Fetch the scalar columns of a biomarker's observations in a date range.
+    Built as a lambda statement so the construct and its cache key are
+    produced once, and later calls only bind the new parameter values
+    before hitting the engine's compiled-statement cache.
+    """
+    stmt = lambda_stmt(lambda: select(
+        Observation.effective_datetime,
+        Observation.value,
+        Observation.unit,
+        Observation.ref_min,
+        Observation.ref_max,
+        Observation.interpretation
+    ).where(
+        Observation.biomarker_id == biomarker_id,
+        Observation.patient_id == patient_id,
+        Observation.effective_datetime >= start_date,
+        Observation.effective_datetime <= end_date
+    ).order_by(Observation.effective_datetime.asc()))
+    return db.session.execute(stmt).all()
+
+
+def _abnormal_biomarker_groups(patient_id):
+    """
+    Aggregate a patient's out-of-range observations per biomarker name.
+    Yields (name, count, values, ISO dates). PostgreSQL collects the values
+    with array_agg; other backends use group_concat and parse the result.
+    """
+    abnormal = db.or_(
+        Observation.value < Observation.ref_min,
+        Observation.value > Observation.ref_max
+    )
+    postgres = db.engine.dialect.name == 'postgresql'
+    if postgres:
+        values_agg = db.func.array_agg(Observation.value)
+        dates_agg = db.func.array_agg(Observation.effective_datetime)
+    else:
+        values_agg = db.func.group_concat(Observation.value, ',')
+        dates_agg = db.func.group_concat(Observation.effective_datetime, ',')
+    
+    rows = db.session.query(
+        Biomarker.name, db.func.count(Observation.id), values_agg, dates_agg
+    ).join(Observation.biomarker).filter(
+        Observation.patient_id == patient_id, abnormal
+    ).group_by(Biomarker.name).all()
+    
+    for name, count, values, dates in rows:
+        if postgres:
+            yield name, count, list(values), [d.isoformat() for d in dates]
+        else:
+            yield (
+                name, count,
+                [float(v) for v in values.split(',')],
+                [datetime.fromisoformat(d).isoformat() for d in dates.split(',')]
+            )
+
+
+def _first_by_biomarker(observations):
+    """Index observations by biomarker id, keeping the first one per biomarker"""
+    by_biomarker = {}
+    for obs in observations:
+        by_biomarker.setdefault(obs.biomarker_id, obs)
+    return by_biomarker
@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify
+from flask import request, jsonify
 from flask_jwt_extended import (
     create_access_token, 
     create_refresh_token, 
@@ -6,18 +6,99 @@ from flask_jwt_extended import (
     get_jwt_identity,
     get_jwt
 )
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
 from app.models import User
 from app.schemas import LoginRequest, UserCreate, UserResponse
 from app import db
+from app.blocklist import revoke_token
+from config import Config
 from datetime import datetime
+from threading import Lock
+from cachetools import TTLCache
+import hashlib
+import os
 import uuid
 
-bp = Blueprint('auth', __name__, url_prefix='/api/v1/auth')
 
+# Recently verified credentials: (username, keyed password digest) -> password_hash.
+# Only successful checks are stored, so repeated logins within the TTL skip the KDF.
+_verified_credentials = TTLCache(maxsize=512, ttl=60)
+_verified_credentials_lock = Lock()
+_credential_digest_key = os.urandom(32)
 
-# Blacklist for revoked tokens
-blacklisted_tokens = set()
+
+# Argon2id hasher for new and upgraded password hashes
+_password_hasher = PasswordHasher(
+    time_cost=Config.ARGON2_TIME_COST,
+    memory_cost=Config.ARGON2_MEMORY_COST,
+    parallelism=Config.ARGON2_PARALLELISM
+)
+
+
+def hash_password(password):
+    """
+    Hash a password with Argon2id.
+    
+    Args:
+        password (str): Plain-text password
+        
+    Returns:
+        str: Encoded hash suitable for User.password_hash
+    """
+    return _password_hasher.hash(password)
+
+
+def _check_password_hash(password_hash, password):
+    """
+    Check a password against an Argon2 hash, or a legacy Werkzeug hash
+    created before the switch to Argon2.
+    """
+    if not password_hash.startswith('$argon2'):
+        return check_password_hash(password_hash, password)
+    try:
+        return _password_hasher.verify(password_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+
+def _needs_rehash(password_hash):
+    """Check whether a stored hash is legacy or uses outdated Argon2 parameters"""
+    return not password_hash.startswith('$argon2') or _password_hasher.check_needs_rehash(password_hash)
+
+
+def _verify_password(username, password_hash, password):
+    """
+    Verify a password against a user's stored hash, using the short-lived
+    cache of successful verifications.
+    
+    Args:
+        username (str): Username the hash belongs to
+        password_hash (str): Stored password hash
+        password (str): Plain-text password supplied by the client
+        
+    Returns:
+        bool: True if the password matches, False otherwise
+    """
+    if not password:
+        return False
+    
+    digest = hashlib.blake2b(password.encode(), digest_size=16, key=_credential_digest_key).digest()
+    cache_key = (username, digest)
+    
+    with _verified_credentials_lock:
+        cached_hash = _verified_credentials.get(cache_key)
+    # Comparing against the current hash means a password change invalidates the entry
+    if cached_hash is not None and cached_hash == password_hash:
+        return True
+    
+    if not _check_password_hash(password_hash, password):
+        return False
+    
+    with _verified_credentials_lock:
+        _verified_credentials[cache_key] = password_hash
+    return True
 
 
 def _validate_password_strength(password):
@@ -33,15 +114,24 @@ def _validate_password_strength(password):
     return len(password) >= 6
 
 
-@bp.route('/login', methods=['POST'])
 def login():
     try:
         data = request.get_json()
         login_request = LoginRequest(**data)
         
-        user = User.query.filter_by(username=login_request.username).first()
+        # Only the columns needed to check the password; the full row is
+        # loaded once the credentials are known to be valid
+        credentials = db.session.query(User.id, User.password_hash).filter(
+            User.username == login_request.username
+        ).first()
         
-        if user and check_password_hash(user.password_hash, login_request.password):
+        if credentials and _verify_password(login_request.username, credentials.password_hash, login_request.password):
+            user = db.session.get(User, credentials.id)
+            
+            # Transparently upgrade legacy hashes
+            if _needs_rehash(user.password_hash):
+                user.password_hash = hash_password(login_request.password)
+            
             # Update last login
             user.last_login = datetime.now()
             db.session.commit()
@@ -61,15 +151,13 @@ def login():
         return jsonify({'error': str(e)}), 400
 
 
-@bp.route('/logout', methods=['POST'])
 @jwt_required()
 def logout():
-    jti = get_jwt()['jti']
-    blacklisted_tokens.add(jti)
+    token = get_jwt()
+    revoke_token(token['jti'], token['exp'])
     return jsonify({'message': 'Successfully logged out'}), 200
 
 
-@bp.route('/refresh', methods=['POST'])
 @jwt_required(refresh=True)
 def refresh():
     current_user_id = get_jwt_identity()
@@ -77,11 +165,10 @@ def refresh():
     return jsonify({'access_token': new_token}), 200
 
 
-@bp.route('/change-password', methods=['POST'])
 @jwt_required()
 def change_password():
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    user = db.session.get(User, current_user_id)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -90,23 +177,22 @@ def change_password():
     old_password = data.get('old_password')
     new_password = data.get('new_password')
     
-    if not check_password_hash(user.password_hash, old_password):
+    if not _verify_password(user.username, user.password_hash, old_password):
         return jsonify({'error': 'Old password is incorrect'}), 400
     
     if not _validate_password_strength(new_password):
         return jsonify({'error': 'New password must be at least 6 characters'}), 400
     
-    user.password_hash = generate_password_hash(new_password)
+    user.password_hash = hash_password(new_password)
     db.session.commit()
     
     return jsonify({'message': 'Password changed successfully'}), 200
 
 
-@bp.route('/session', methods=['GET'])
 @jwt_required()
 def get_session():
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    user = db.session.get(User, current_user_id)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -114,7 +200,6 @@ def get_session():
     return jsonify({'user': UserResponse.from_orm(user).dict()}), 200
 
 
-@bp.route('/session/<int:session_id>', methods=['DELETE'])
 @jwt_required()
 def delete_session(session_id):
     # In a real implementation, we would manage active sessions
@@ -128,7 +213,7 @@ def init_default_user():
     if not admin_user:
         admin_user = User(
             username='admin',
-            password_hash=generate_password_hash('admin123'),
+            password_hash=hash_password('admin123'),
             email='admin@example.com',
             role='admin'
         )
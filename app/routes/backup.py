@@ -1,19 +1,36 @@
-from flask import Blueprint, request, jsonify
+from flask import request, jsonify
 from flask_jwt_extended import jwt_required
-from app import db
+from app import db, upgrade_schema
 from config import Config
 import os
+import re
 import shutil
 import zipfile
+import tarfile
+import zstandard
 import sqlite3
 from datetime import datetime
+from collections import deque
+from functools import lru_cache
 from app.schemas import BackupCreateRequest, BackupResponse
-import glob
+from app.cache import clear_response_cache
+from app.services.ai_provider import clear_fhir_context_cache
+from app.services.terminology import clear_code_tables
 
-bp = Blueprint('backup', __name__, url_prefix='/api/v1/backup')
+# New backups are zstd-compressed tarballs; .zip backups from older
+# versions can still be listed and restored
+BACKUP_EXTENSION = '.tar.zst'
+BACKUP_EXTENSIONS = (BACKUP_EXTENSION, '.zip')
+# Paths derived from configuration, resolved once at import
+_DB_PATH = Config.SQLALCHEMY_DATABASE_URI.removeprefix('sqlite:///')
+_DB_BASENAME = os.path.basename(_DB_PATH)
+_DATA_DIR = os.path.join('app', 'data')
+# Archive paths are relative to the data directory's parent (i.e. start with "data/")
+_DATA_PREFIX_LEN = len(os.path.dirname(_DATA_DIR)) + 1
+
+_BACKUP_FILENAME_RE = re.compile(r'^(?P<name>.*)_(?P<timestamp>\d{8}_\d{6})(?:\.tar\.zst|\.zip)$')
 
 
-@bp.route('/create', methods=['POST'])
 @jwt_required()
 def create_backup():
     """Create a backup of the database and documents"""
@@ -28,24 +45,28 @@ def create_backup():
         # Generate backup filename
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         backup_name = req.name or f"backup_{timestamp}"
-        backup_filename = f"{backup_name}_{timestamp}.zip"
+        backup_filename = f"{backup_name}_{timestamp}{BACKUP_EXTENSION}"
         backup_path = os.path.join(backup_dir, backup_filename)
         
-        # Create a zip file with database and documents
-        with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED) as backup_zip:
-            # Add database file to backup
-            db_path = Config.SQLALCHEMY_DATABASE_URI.replace('sqlite:///', '')
-            if os.path.exists(db_path):
-                backup_zip.write(db_path, os.path.basename(db_path))
+        # Create a multi-threaded zstd tarball with database and documents
+        compressor = zstandard.ZstdCompressor(level=3, threads=-1)
+        with open(backup_path, 'wb') as backup_file, \
+                compressor.stream_writer(backup_file) as compressed, \
+                tarfile.open(mode='w|', fileobj=compressed, copybufsize=1 << 20) as backup_tar:
+            # Add a consistent snapshot of the database file to backup
+            if os.path.exists(_DB_PATH):
+                snapshot_path = os.path.join(backup_dir, f".{backup_filename}.db")
+                try:
+                    _snapshot_sqlite(_DB_PATH, snapshot_path)
+                    backup_tar.add(snapshot_path, _DB_BASENAME)
+                finally:
+                    if os.path.exists(snapshot_path):
+                        os.remove(snapshot_path)
             
             # Add data directory (with patient documents) to backup
-            data_dir = os.path.join('app', 'data')
-            if os.path.exists(data_dir):
-                for root, dirs, files in os.walk(data_dir):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        archive_path = os.path.relpath(file_path, os.path.dirname(data_dir))
-                        backup_zip.write(file_path, archive_path)
+            if os.path.exists(_DATA_DIR):
+                for file_path in _iter_files(_DATA_DIR):
+                    backup_tar.add(file_path, file_path[_DATA_PREFIX_LEN:], recursive=False)
         
         # Get file size
         file_size = os.path.getsize(backup_path)
@@ -67,7 +88,6 @@ def create_backup():
         return jsonify({'error': str(e)}), 500
 
 
-@bp.route('/list', methods=['GET'])
 @jwt_required()
 def list_backups():
     """List all available backups"""
@@ -77,30 +97,26 @@ def list_backups():
             os.makedirs(backup_dir, exist_ok=True)
         
         # Find all backup files
-        backup_pattern = os.path.join(backup_dir, "*.zip")
-        backup_files = glob.glob(backup_pattern)
+        backup_entries = _find_backups(backup_dir)
         
         backups = []
-        for backup_path in backup_files:
-            filename = os.path.basename(backup_path)
-            stat = os.stat(backup_path)
+        for entry in backup_entries:
+            filename = entry.name
+            stat = entry.stat()
             
-            # Try to extract name and date from filename
-            name_parts = filename.split('_')
-            if len(name_parts) >= 3 and name_parts[-1].endswith('.zip'):
-                # Format: name_timestamp.zip
-                backup_name = '_'.join(name_parts[:-2])
-                date_str = name_parts[-2]
-                time_str = name_parts[-1].replace('.zip', '')
+            # Extract name and date from filename (name_YYYYmmdd_HHMMSS.<ext>)
+            match = _BACKUP_FILENAME_RE.match(filename)
+            created_at = None
+            if match:
+                backup_name = match['name']
+                try:
+                    created_at = _parse_backup_timestamp(match['timestamp'])
+                except ValueError:
+                    pass
             else:
-                backup_name = filename.replace('.zip', '')
-                date_str = ''
-                time_str = ''
+                backup_name = _strip_backup_extension(filename)
             
-            try:
-                # Parse date from filename if possible
-                created_at = datetime.strptime(f"{date_str}_{time_str}", "%Y%m%d_%H%M%S")
-            except ValueError:
+            if created_at is None:
                 # If parsing fails, use file modification time
                 created_at = datetime.fromtimestamp(stat.st_mtime)
             
@@ -109,7 +125,7 @@ def list_backups():
                 name=backup_name,
                 size=stat.st_size,
                 created_at=created_at,
-                path=backup_path
+                path=entry.path
             )
             
             backups.append(backup_response.dict())
@@ -123,7 +139,6 @@ def list_backups():
         return jsonify({'error': str(e)}), 500
 
 
-@bp.route('/restore', methods=['POST'])
 @jwt_required()
 def restore_backup():
     """Restore from a backup"""
@@ -143,41 +158,44 @@ def restore_backup():
         # Close all database connections before restoring
         db.engine.dispose()
         
-        # Extract the backup
-        with zipfile.ZipFile(backup_path, 'r') as backup_zip:
-            # Extract to a temporary location first
-            temp_extract_dir = os.path.join(backup_dir, 'temp_restore')
-            backup_zip.extractall(temp_extract_dir)
-            
-            # Replace the current database and data files
-            extracted_db_path = os.path.join(temp_extract_dir, os.path.basename(Config.SQLALCHEMY_DATABASE_URI.replace('sqlite:///', '')))
-            if os.path.exists(extracted_db_path):
-                # Stop any active connections and replace the database
-                current_db_path = Config.SQLALCHEMY_DATABASE_URI.replace('sqlite:///', '')
-                if os.path.exists(current_db_path):
-                    os.remove(current_db_path)
-                shutil.move(extracted_db_path, current_db_path)
-            
-            # Restore data directory
-            extracted_data_dir = os.path.join(temp_extract_dir, 'data')
-            if os.path.exists(extracted_data_dir):
-                current_data_dir = os.path.join('app', 'data')
-                if os.path.exists(current_data_dir):
-                    shutil.rmtree(current_data_dir)
-                shutil.move(extracted_data_dir, current_data_dir)
+        # Extract the backup to a temporary location first
+        temp_extract_dir = os.path.join(backup_dir, 'temp_restore')
+        _extract_backup(backup_path, temp_extract_dir)
+        
+        # Replace the current database and data files
+        extracted_db_path = os.path.join(temp_extract_dir, _DB_BASENAME)
+        if os.path.exists(extracted_db_path):
+            # Stop any active connections and replace the database
+            if os.path.exists(_DB_PATH):
+                os.remove(_DB_PATH)
+            shutil.move(extracted_db_path, _DB_PATH)
+        
+        # Restore data directory
+        extracted_data_dir = os.path.join(temp_extract_dir, 'data')
+        if os.path.exists(extracted_data_dir):
+            if os.path.exists(_DATA_DIR):
+                shutil.rmtree(_DATA_DIR)
+            shutil.move(extracted_data_dir, _DATA_DIR)
         
         # Clean up temp directory
-        temp_extract_dir = os.path.join(backup_dir, 'temp_restore')
         if os.path.exists(temp_extract_dir):
             shutil.rmtree(temp_extract_dir)
         
+        # The backup may have been taken by an older version
+        db.create_all()
+        upgrade_schema()
+
+        # Nothing cached from the replaced database may be served again
+        clear_response_cache()
+        clear_fhir_context_cache()
+        clear_code_tables()
+        
         return jsonify({'message': 'Backup restored successfully'}), 200
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
-@bp.route('/<backup_id>', methods=['DELETE'])
 @jwt_required()
 def delete_backup(backup_id):
     """Delete a specific backup"""
@@ -204,9 +222,8 @@ def cleanup_old_backups():
             return
         
         # Get all backup files sorted by modification time (oldest first)
-        backup_pattern = os.path.join(backup_dir, "*.zip")
-        backup_files = glob.glob(backup_pattern)
-        backup_files.sort(key=os.path.getmtime)
+        backup_entries = _find_backups(backup_dir)
+        backup_entries.sort(key=lambda entry: entry.stat().st_mtime)
         
         # Calculate cutoff date
         retention_days = Config.DATABASE_BACKUP_RETENTION_DAYS
@@ -214,11 +231,82 @@ def cleanup_old_backups():
         
         # Remove old backups
         removed_count = 0
-        for backup_file in backup_files:
-            if os.path.getmtime(backup_file) < cutoff_time:
-                os.remove(backup_file)
-                removed_count += 1
+        for entry in backup_entries:
+            if entry.stat().st_mtime >= cutoff_time:
+                break  # sorted oldest first, so the rest are newer
+            os.remove(entry.path)
+            removed_count += 1
         
         print(f"Cleaned up {removed_count} old backups")
     except Exception as e:
-        print(f"Error cleaning up old backups: {str(e)}")
\ No newline at end of file
+        print(f"Error cleaning up old backups: {str(e)}")
+
+
+def _find_backups(backup_dir):
+    """
+    List backup archives of every supported format in the backup directory
+    as os.DirEntry objects (their stat results are cached after first use).
+    """
+    with os.scandir(backup_dir) as entries:
+        return [
+            entry for entry in entries
+            if entry.name.endswith(BACKUP_EXTENSIONS) and entry.is_file()
+        ]
+
+
+@lru_cache(maxsize=1024)
+def _parse_backup_timestamp(timestamp):
+    """Parse the YYYYmmdd_HHMMSS timestamp embedded in backup filenames"""
+    return datetime.strptime(timestamp, "%Y%m%d_%H%M%S")
+
+
+def _strip_backup_extension(filename):
+    """Remove the archive extension from a backup filename"""
+    for extension in BACKUP_EXTENSIONS:
+        if filename.endswith(extension):
+            return filename[:-len(extension)]
+    return filename
+
+
+def _snapshot_sqlite(db_path, snapshot_path):
+    """
+    Copy a live SQLite database with the online backup API, which yields a
+    consistent snapshot even while the application keeps writing to it.
+    """
+    source = sqlite3.connect(db_path)
+    try:
+        target = sqlite3.connect(snapshot_path)
+        try:
+            source.backup(target, pages=1024)
+        finally:
+            target.close()
+    finally:
+        source.close()
+
+
+def _iter_files(directory):
+    """Yield file paths under a directory, walking it iteratively with os.scandir"""
+    pending = deque([directory])
+    while pending:
+        with os.scandir(pending.popleft()) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    yield entry.path
+                elif entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+
+
+def _extract_backup(backup_path, target_dir):
+    """Extract a .tar.zst or legacy .zip backup into target_dir"""
+    if backup_path.endswith('.zip'):
+        with zipfile.ZipFile(backup_path, 'r') as backup_zip:
+            backup_zip.extractall(target_dir)
+        return
+    
+    decompressor = zstandard.ZstdDecompressor()
+    with open(backup_path, 'rb') as backup_file, \
+            decompressor.stream_reader(backup_file) as decompressed, \
+            tarfile.open(mode='r|', fileobj=decompressed) as backup_tar:
+        # Reject unsafe member paths where the running Python supports it
+        filter_kwargs = {'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}
+        backup_tar.extractall(target_dir, **filter_kwargs)
@@ -1,22 +1,108 @@
-from flask import Blueprint, request, jsonify, send_file, current_app
+from flask import request, jsonify, send_file, current_app
 from flask_jwt_extended import jwt_required
 from werkzeug.utils import secure_filename
-from app.models import MedicalDocument, Patient, TestReport
-from app.schemas import MedicalDocumentCreate, MedicalDocumentResponse
+from app.models import MedicalDocument, Patient, TestReport, record_exists
+from app.schemas import MedicalDocumentCreate, MedicalDocumentResponse, MedicalDocumentListAdapter, dump_orm_list
 from app import db
+from config import Config
 import os
+import hashlib
+import mimetypes
+import mmap
+import io
+import tempfile
 from datetime import datetime
 import uuid
 
-bp = Blueprint('documents', __name__, url_prefix='/api/v1/documents')
-
 
 def allowed_file(filename, allowed_extensions):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in allowed_extensions
 
 
-@bp.route('/upload', methods=['POST'])
+def save_and_hash(file, filepath, chunk_size=1 << 20):
+    """
+    Save an uploaded file to disk and compute its SHA-256.
+    Uploads Werkzeug has already spooled to a temporary file are copied
+    in the kernel with copy_file_range and hashed through a read-only
+    memory map; in-memory uploads (or platforms without copy_file_range)
+    are streamed in chunks, hashing on the way.
+    
+    Returns:
+        str: Hex digest of the file content
+    """
+    source_fd = _spooled_fileno(file.stream)
+    if source_fd is not None:
+        try:
+            return _copy_and_hash_fd(source_fd, filepath)
+        except OSError:
+            pass  # e.g. copy_file_range unsupported for these files; copy in user space
+    
+    digest = hashlib.sha256()
+    file.stream.seek(0)
+    with open(filepath, 'wb') as out:
+        while chunk := file.stream.read(chunk_size):
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest()
+
+
+def _spooled_fileno(stream):
+    """Get the descriptor of an upload stream backed by a real file, or None"""
+    if not hasattr(os, 'copy_file_range'):
+        return None
+    # fileno() would force an in-memory spooled file to roll over to disk
+    if isinstance(stream, tempfile.SpooledTemporaryFile) and not stream._rolled:
+        return None
+    try:
+        stream.flush()
+        return stream.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+
+
+def _copy_and_hash_fd(source_fd, filepath):
+    """Copy a file descriptor's content to filepath in the kernel and hash it via mmap"""
+    size = os.fstat(source_fd).st_size
+    digest = hashlib.sha256()
+    if size:
+        with mmap.mmap(source_fd, 0, access=mmap.ACCESS_READ) as mapped:
+            digest.update(mapped)
+    
+    target_fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        offset = 0
+        while offset < size:
+            copied = os.copy_file_range(source_fd, target_fd, size - offset, offset_src=offset)
+            if not copied:
+                break
+            offset += copied
+    finally:
+        os.close(target_fd)
+    return digest.hexdigest()
+
+
+def send_document(document, as_attachment=False):
+    """
+    Send a document's file, delegating the transfer to nginx via
+    X-Accel-Redirect when X_ACCEL_REDIRECT_PREFIX is configured. Otherwise
+    send_file is used, which emits X-Sendfile when USE_X_SENDFILE is set.
+    """
+    accel_prefix = current_app.config.get('X_ACCEL_REDIRECT_PREFIX')
+    if not accel_prefix:
+        return send_file(document.filepath, as_attachment=as_attachment)
+    
+    patients_dir = os.path.join(current_app.root_path, 'data', 'patients')
+    relative_path = os.path.relpath(document.filepath, patients_dir).replace(os.sep, '/')
+    mimetype = mimetypes.guess_type(document.filepath)[0] or 'application/octet-stream'
+    
+    response = current_app.response_class(mimetype=mimetype)
+    response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{relative_path}"
+    if as_attachment:
+        response.headers.set('Content-Disposition', 'attachment', filename=os.path.basename(document.filepath))
+    return response
+
+
 @jwt_required()
 def upload_document():
     if 'file' not in request.files:
@@ -35,26 +121,25 @@ def upload_document():
         return jsonify({'error': 'Patient ID is required'}), 400
     
     # Verify patient exists
-    patient = Patient.query.get(patient_id)
-    if not patient:
+    if not record_exists(Patient, patient_id):
         return jsonify({'error': 'Patient not found'}), 404
     
     # Verify report exists if provided
     if report_id:
-        report = TestReport.query.get(report_id)
-        if not report:
+        if not record_exists(TestReport, report_id):
             return jsonify({'error': 'Report not found'}), 404
     
     # Validate file
-    from config import Config
     if not allowed_file(file.filename, Config.ALLOWED_FILE_TYPES):
         return jsonify({'error': f'File type not allowed. Allowed types: {", ".join(Config.ALLOWED_FILE_TYPES)}'}), 400
     
-    if len(file.read()) > Config.FILE_UPLOAD_MAX_SIZE:
+    # The parsed upload is already spooled; its size is the end-of-stream offset
+    file.stream.seek(0, os.SEEK_END)
+    upload_size = file.stream.tell()
+    file.stream.seek(0)
+    if upload_size > Config.FILE_UPLOAD_MAX_SIZE:
         return jsonify({'error': f'File too large. Maximum size: {Config.FILE_UPLOAD_MAX_SIZE} bytes'}), 400
     
-    file.seek(0)  # Reset file pointer after reading for size check
-    
     # Generate secure filename
     original_filename = secure_filename(file.filename)
     file_ext = original_filename.rsplit('.', 1)[1].lower()
@@ -66,8 +151,19 @@ def upload_document():
     
     filepath = os.path.join(patient_dir, unique_filename)
     
-    # Save file
-    file.save(filepath)
+    # Save file, hashing it while it streams to disk
+    content_sha256 = save_and_hash(file, filepath)
+    
+    # Identical content already stored for this patient: share it via a hard link
+    duplicate = MedicalDocument.query.filter_by(
+        patient_id=patient_id, content_sha256=content_sha256
+    ).first()
+    if duplicate and os.path.exists(duplicate.filepath):
+        try:
+            os.remove(filepath)
+            os.link(duplicate.filepath, filepath)
+        except OSError:
+            save_and_hash(file, filepath)  # e.g. no hard link support; keep a copy
     
     # Create document record
     file_size = os.path.getsize(filepath)
@@ -77,6 +173,7 @@ def upload_document():
         filepath=filepath,
         file_type=file_ext,
         file_size=file_size,
+        content_sha256=content_sha256,
         report_id=report_id,
         description=description
     )
@@ -87,7 +184,6 @@ def upload_document():
     return jsonify(MedicalDocumentResponse.from_orm(document).dict()), 201
 
 
-@bp.route('/<int:document_id>/download', methods=['GET'])
 @jwt_required()
 def download_document(document_id):
     document = MedicalDocument.query.get_or_404(document_id)
@@ -95,10 +191,9 @@ def download_document(document_id):
     if not os.path.exists(document.filepath):
         return jsonify({'error': 'File not found on disk'}), 404
     
-    return send_file(document.filepath, as_attachment=True)
+    return send_document(document, as_attachment=True)
 
 
-@bp.route('/<int:document_id>/preview', methods=['GET'])
 @jwt_required()
 def preview_document(document_id):
     document = MedicalDocument.query.get_or_404(document_id)
@@ -108,10 +203,9 @@ def preview_document(document_id):
     
     # For images, send the file directly
     # For PDFs, might need special handling depending on frontend needs
-    return send_file(document.filepath)
+    return send_document(document)
 
 
-@bp.route('/<int:document_id>', methods=['DELETE'])
 @jwt_required()
 def delete_document(document_id):
     document = MedicalDocument.query.get_or_404(document_id)
@@ -127,7 +221,6 @@ def delete_document(document_id):
     return jsonify({'message': 'Document deleted successfully'}), 200
 
 
-@bp.route('', methods=['GET'])
 @jwt_required()
 def get_documents():
     patient_id = request.args.get('patient', type=int)
@@ -150,7 +243,7 @@ def get_documents():
     )
     
     return jsonify({
-        'documents': [MedicalDocumentResponse.from_orm(doc).dict() for doc in documents.items],
+        'documents': dump_orm_list(MedicalDocumentListAdapter, documents.items),
         'total': documents.total,
         'pages': documents.pages,
         'current_page': page
@@ -1,37 +1,159 @@
-from flask import Blueprint, request, jsonify
+from flask import request, current_app, abort, stream_with_context, url_for
 from flask_jwt_extended import jwt_required
-from app.models import Patient, Observation, TestReport
-from app.services.fhir_mapper import FHIRMapper
+from app.models import (
+    Patient, Observation, TestReport, Biomarker, LOINCCode,
+    bulk_insert_observations, bulk_insert_rows, delete_patient_cascade, delete_report_cascade,
+    has_at_least, load_options, mark_patients_changed
+)
+from app.services.fhir_mapper import FHIRMapper, parse_fhir_datetime
+from app.json_provider import dumps_fhir, fhir_response
+from app.pagination import keyset_page
+from app.cache import cached_response, TTL_NORMAL
 from app import db
+from config import Config
 from datetime import datetime
+from functools import lru_cache
+import re
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import joinedload, lazyload, load_only, selectinload
 
-bp = Blueprint('fhir', __name__, url_prefix='/fhir')
+
+# Row projection read by FHIRMapper.observation_row_to_fhir
+OBSERVATION_FHIR_COLUMNS = (
+    *Observation.__table__.c,
+    Biomarker.name.label('biomarker_name'),
+    Biomarker.loinc_code_id,
+    Biomarker.ucum_unit_id,
+    Patient.fhir_id.label('patient_fhir_id'),
+)
+
+
+def _observation_rows():
+    """Query projecting OBSERVATION_FHIR_COLUMNS rows, with biomarker and patient joined"""
+    return db.session.query(*OBSERVATION_FHIR_COLUMNS).join(
+        Biomarker, Observation.biomarker_id == Biomarker.id
+    ).join(
+        Patient, Observation.patient_id == Patient.id
+    )
+
+
+def _patient_fhir_id_option(relationship):
+    """Join just the related patient's fhir_id, skipping the selectin loads of its collections"""
+    return joinedload(relationship).options(load_only(Patient.fhir_id), lazyload('*'))
+
+
+def _observation_load_options():
+    """Load an Observation with everything observation_to_fhir reads, in one query"""
+    return load_options(
+        joinedload(Observation.biomarker).lazyload('*'),
+        _patient_fhir_id_option(Observation.patient),
+    )
+
+
+def _report_load_options():
+    """Load a TestReport with everything report_to_fhir reads, in one query"""
+    return load_options(_patient_fhir_id_option(TestReport.patient))
+
+
+# Literal Patient reference, e.g. "Patient/3f2c..."; captures the fhir_id
+_PATIENT_REF_RE = re.compile(r'^Patient/([A-Za-z0-9._\-]+)$')
+
+
+@lru_cache(maxsize=1024)
+def parse_patient_ref(ref):
+    """Get the patient fhir_id from a literal Patient reference, or None if it is not one"""
+    match = _PATIENT_REF_RE.match(ref or '')
+    return match.group(1) if match else None
+
+
+def _subject_fhir_id(resource):
+    """Get the patient fhir_id a resource's subject refers to, or None"""
+    return parse_patient_ref(resource.get('subject', {}).get('reference'))
+
+
+def _resolve_patient_id(patient_id):
+    """
+    Resolve an internal or FHIR patient id to the internal id, or None.
+    Each lookup filters a single indexed column (primary key or the unique
+    fhir_id) instead of OR-ing both.
+    """
+    if patient_id.isdigit():
+        found = db.session.scalar(select(Patient.id).where(Patient.id == int(patient_id)))
+        if found is not None:
+            return found
+    return db.session.scalar(select(Patient.id).where(Patient.fhir_id == patient_id))
+
+
+def _patient_of(model, patient_column, view_arg):
+    """
+    Build a cached_response resolver that maps the resource fhir_id in
+    `view_arg` to its patient id, so cached FHIR reads are dropped together
+    with that patient's other cached responses.
+    """
+    def resolve(view_args):
+        return db.session.scalar(select(patient_column).where(model.fhir_id == view_args[view_arg]))
+    return resolve
+
+
+def _searched_patient(view_args):
+    """cached_response resolver for searches; only patient-filtered searches are cached"""
+    patient_id = request.args.get('patient')
+    return _resolve_patient_id(patient_id) if patient_id else None
+
+
+def _search_links(next_cursor):
+    """Build a searchset Bundle's links; `next` carries the cursor for the following page"""
+    links = [{"relation": "self", "url": request.url}]
+    if next_cursor:
+        args = request.args.to_dict()
+        args['_cursor'] = next_cursor
+        links.append({"relation": "next", "url": url_for(request.endpoint, _external=True, **args)})
+    return links
 
 
-@bp.route('/Patient', methods=['GET'])
 @jwt_required()
 def search_patients():
     # Basic search parameters
     name = request.args.get('_name')
     identifier = request.args.get('identifier')
     
-    query = Patient.query
+    # Search results are summaries: load only the columns they show and
+    # skip the default selectin loads of the patient's collections
+    query = Patient.query.options(
+        load_only(Patient.id, Patient.fhir_id, Patient.name, Patient.gender, Patient.birth_date),
+        lazyload('*'),
+        *load_options()
+    )
     
     if name:
-        query = query.filter(Patient.name.contains(name))
+        # Case-insensitive substring match; on PostgreSQL ILIKE is served by
+        # the trigram index for terms of 3 or more characters
+        escaped = name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        query = query.filter(Patient.name.ilike(f'%{escaped}%', escape='\\'))
     
     if identifier:
         query = query.filter(Patient.id == identifier)
     
-    # Apply pagination
-    page = request.args.get('page', 1, type=int)
-    count = min(request.args.get('_count', 20, type=int), 100)  # FHIR-style pagination
+    # The total is only counted when explicitly requested
+    if request.args.get('_summary') == 'count':
+        return fhir_response({
+            "resourceType": "Bundle",
+            "type": "searchset",
+            "total": query.order_by(None).count()
+        }, 200)
     
-    patients = query.paginate(page=page, per_page=count, error_out=False)
+    # Apply keyset pagination: `_cursor` continues after the previous page
+    count = min(request.args.get('_count', 20, type=int), 100)  # FHIR-style pagination
+    try:
+        patients, next_cursor = keyset_page(
+            query, (Patient.id,), request.args.get('_cursor'), count
+        )
+    except ValueError as e:
+        return fhir_response({'error': str(e)}, 400)
     
     entries = []
-    for patient in patients.items:
-        fhir_patient = FHIRMapper.patient_to_fhir(patient)
+    for patient in patients:
+        fhir_patient = FHIRMapper.patient_to_fhir_summary(patient)
         entries.append({
             "fullUrl": f"/fhir/Patient/{patient.fhir_id}",
             "resource": fhir_patient
@@ -40,28 +162,23 @@ def search_patients():
     bundle = {
         "resourceType": "Bundle",
         "type": "searchset",
-        "total": patients.total,
         "entry": entries,
-        "link": [
-            {
-                "relation": "self",
-                "url": request.url
-            }
-        ]
+        "link": _search_links(next_cursor)
     }
     
-    return jsonify(bundle), 200
+    return fhir_response(bundle, 200)
 
 
-@bp.route('/Patient/<string:patient_id>', methods=['GET'])
 @jwt_required()
+@cached_response(
+    'fhir-patient', ttl=TTL_NORMAL, resolve_patient=_patient_of(Patient, Patient.id, 'patient_id'), mimetype='application/fhir+json'
+)
 def get_patient(patient_id):
     patient = Patient.query.filter_by(fhir_id=patient_id).first_or_404()
     fhir_patient = FHIRMapper.patient_to_fhir(patient)
-    return jsonify(fhir_patient), 200
+    return fhir_response(fhir_patient, 200)
 
 
-@bp.route('/Patient/<string:patient_id>', methods=['PUT'])
 @jwt_required()
 def update_patient(patient_id):
     patient = Patient.query.filter_by(fhir_id=patient_id).first_or_404()
@@ -79,13 +196,12 @@ def update_patient(patient_id):
         db.session.commit()
         
         fhir_patient_response = FHIRMapper.patient_to_fhir(patient)
-        return jsonify(fhir_patient_response), 200
+        return fhir_response(fhir_patient_response, 200)
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': str(e)}), 400
+        return fhir_response({'error': str(e)}, 400)
 
 
-@bp.route('/Patient/<string:patient_id>', methods=['PATCH'])
 @jwt_required()
 def patch_patient(patient_id):
     patient = Patient.query.filter_by(fhir_id=patient_id).first_or_404()
@@ -103,7 +219,7 @@ def patch_patient(patient_id):
             patient.gender = fhir_patient['gender']
         
         if 'birthDate' in fhir_patient:
-            patient.birth_date = datetime.fromisoformat(fhir_patient['birthDate'])
+            patient.birth_date = parse_fhir_datetime(fhir_patient['birthDate'])
         
         if 'note' in fhir_patient:
             notes = fhir_patient['note']
@@ -113,39 +229,29 @@ def patch_patient(patient_id):
         db.session.commit()
         
         fhir_patient_response = FHIRMapper.patient_to_fhir(patient)
-        return jsonify(fhir_patient_response), 200
+        return fhir_response(fhir_patient_response, 200)
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': str(e)}), 400
+        return fhir_response({'error': str(e)}, 400)
 
 
-@bp.route('/Patient/<string:patient_id>', methods=['DELETE'])
 @jwt_required()
 def delete_patient(patient_id):
-    patient = Patient.query.filter_by(fhir_id=patient_id).first_or_404()
-    
-    # Delete related records first due to foreign key constraints
-    from app.models import MedicalDocument, Observation, TestReport
-    MedicalDocument.query.filter_by(patient_id=patient.id).delete()
-    Observation.query.filter_by(patient_id=patient.id).delete()
-    TestReport.query.filter_by(patient_id=patient.id).delete()
-    
-    db.session.delete(patient)
+    # One DELETE; related records are removed by the database
+    if delete_patient_cascade(Patient.fhir_id == patient_id) is None:
+        abort(404)
     db.session.commit()
     
     return '', 204
 
 
-@bp.route('/Patient', methods=['POST'])
 @jwt_required()
 def create_patient():
     # Check if we've reached the maximum number of patient profiles
-    from config import Config
-    patient_count = Patient.query.count()
-    if patient_count >= Config.MAX_PATIENT_PROFILES:
-        return jsonify({
+    if has_at_least(Patient, Config.MAX_PATIENT_PROFILES):
+        return fhir_response({
             'error': f'Maximum number of patient profiles ({Config.MAX_PATIENT_PROFILES}) reached'
-        }), 400
+        }, 400)
     
     try:
         fhir_patient = request.get_json()
@@ -155,54 +261,58 @@ def create_patient():
         db.session.commit()
         
         fhir_patient_response = FHIRMapper.patient_to_fhir(new_patient)
-        return jsonify(fhir_patient_response), 201
+        return fhir_response(fhir_patient_response, 201)
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': str(e)}), 400
+        return fhir_response({'error': str(e)}, 400)
 
 
-@bp.route('/Observation', methods=['GET'])
 @jwt_required()
+@cached_response(
+    'fhir-observations', ttl=TTL_NORMAL, resolve_patient=_searched_patient, mimetype='application/fhir+json'
+)
 def search_observations():
     patient_id = request.args.get('patient')
     code = request.args.get('code')  # LOINC code
     date_from = request.args.get('date=ge')  # FHIR-style date filtering
     date_to = request.args.get('date=le')    # FHIR-style date filtering
     
-    query = Observation.query
+    # Project plain rows (no ORM objects) with the biomarker and patient
+    # fields the FHIR resource needs
+    query = _observation_rows()
     
     if patient_id:
         # Handle both internal ID and FHIR ID
-        patient = Patient.query.filter(
-            (Patient.id == patient_id) | (Patient.fhir_id == patient_id)
-        ).first()
-        if patient:
-            query = query.filter(Observation.patient_id == patient.id)
+        resolved_id = _resolve_patient_id(patient_id)
+        if resolved_id:
+            query = query.filter(Observation.patient_id == resolved_id)
     
     if code:
         # Filter by biomarker that has the specified LOINC code
-        from app.models import Biomarker, LOINCCode
-        query = query.join(Biomarker).join(Biomarker.loinc).filter(
+        query = query.join(LOINCCode, Biomarker.loinc_code_id == LOINCCode.id).filter(
             LOINCCode.code == code
         )
     
     if date_from:
-        date_from_obj = datetime.fromisoformat(date_from.replace('Z', '+00:00'))
+        date_from_obj = parse_fhir_datetime(date_from)
         query = query.filter(Observation.effective_datetime >= date_from_obj)
     
     if date_to:
-        date_to_obj = datetime.fromisoformat(date_to.replace('Z', '+00:00'))
+        date_to_obj = parse_fhir_datetime(date_to)
         query = query.filter(Observation.effective_datetime <= date_to_obj)
     
-    # Apply pagination
-    page = request.args.get('page', 1, type=int)
+    # Apply keyset pagination: `_cursor` continues after the previous page
     count = min(request.args.get('_count', 20, type=int), 100)
-    
-    observations = query.paginate(page=page, per_page=count, error_out=False)
+    try:
+        observations, next_cursor = keyset_page(
+            query, (Observation.effective_datetime, Observation.id), request.args.get('_cursor'), count
+        )
+    except ValueError as e:
+        return fhir_response({'error': str(e)}, 400)
     
     entries = []
-    for observation in observations.items:
-        fhir_observation = FHIRMapper.observation_to_fhir(observation)
+    for observation in observations:
+        fhir_observation = FHIRMapper.observation_row_to_fhir(observation)
         entries.append({
             "fullUrl": f"/fhir/Observation/{observation.fhir_id}",
             "resource": fhir_observation
@@ -211,95 +321,80 @@ def search_observations():
     bundle = {
         "resourceType": "Bundle",
         "type": "searchset",
-        "total": observations.total,
         "entry": entries,
-        "link": [
-            {
-                "relation": "self",
-                "url": request.url
-            }
-        ]
+        "link": _search_links(next_cursor)
     }
     
-    return jsonify(bundle), 200
+    return fhir_response(bundle, 200)
 
 
-@bp.route('/Observation/<string:observation_id>', methods=['GET'])
 @jwt_required()
+@cached_response(
+    'fhir-observation', ttl=TTL_NORMAL, resolve_patient=_patient_of(Observation, Observation.patient_id, 'observation_id'), mimetype='application/fhir+json'
+)
 def get_observation(observation_id):
-    observation = Observation.query.filter_by(fhir_id=observation_id).first_or_404()
+    observation = Observation.query.options(*_observation_load_options()).filter_by(fhir_id=observation_id).first_or_404()
     fhir_observation = FHIRMapper.observation_to_fhir(observation)
-    return jsonify(fhir_observation), 200
+    return fhir_response(fhir_observation, 200)
 
 
-@bp.route('/Observation', methods=['POST'])
 @jwt_required()
 def create_observation():
     try:
         fhir_observation = request.get_json()
         
         # Extract patient and report IDs from references
-        subject_ref = fhir_observation.get('subject', {}).get('reference', '')
-        if not subject_ref.startswith('Patient/'):
-            return jsonify({'error': 'Invalid patient reference'}), 400
+        patient_fhir_id = _subject_fhir_id(fhir_observation)
+        if not patient_fhir_id:
+            return fhir_response({'error': 'Invalid patient reference'}, 400)
         
-        patient_fhir_id = subject_ref.split('/')[1]
-        patient = Patient.query.filter_by(fhir_id=patient_fhir_id).first()
-        if not patient:
-            return jsonify({'error': 'Patient not found'}), 404
+        patient_id = db.session.scalar(select(Patient.id).where(Patient.fhir_id == patient_fhir_id))
+        if not patient_id:
+            return fhir_response({'error': 'Patient not found'}, 404)
         
         # For this implementation, we'll need to extract or create a report ID
         # In a real implementation, this would come from the FHIR resource or be created
         report_id = 1  # Placeholder - in real implementation, handle report reference properly
         
-        new_observation = FHIRMapper.fhir_to_observation(fhir_observation, patient.id, report_id)
+        new_observation = FHIRMapper.fhir_to_observation(fhir_observation, patient_id, report_id)
         
         db.session.add(new_observation)
         db.session.commit()
         
-        fhir_observation_response = FHIRMapper.observation_to_fhir(new_observation)
-        return jsonify(fhir_observation_response), 201
+        fhir_observation_response = FHIRMapper.observation_to_fhir(new_observation, patient_fhir_id)
+        return fhir_response(fhir_observation_response, 201)
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': str(e)}), 400
+        return fhir_response({'error': str(e)}, 400)
 
 
-@bp.route('/Observation/<string:observation_id>', methods=['PUT'])
 @jwt_required()
 def update_observation(observation_id):
-    observation = Observation.query.filter_by(fhir_id=observation_id).first_or_404()
+    observation = Observation.query.options(*_observation_load_options()).filter_by(fhir_id=observation_id).first_or_404()
     
     try:
         fhir_observation = request.get_json()
         
         # Extract patient and report IDs from references
-        subject_ref = fhir_observation.get('subject', {}).get('reference', '')
-        if not subject_ref.startswith('Patient/'):
-            return jsonify({'error': 'Invalid patient reference'}), 400
-        
-        patient_fhir_id = subject_ref.split('/')[1]
-        patient = Patient.query.filter_by(fhir_id=patient_fhir_id).first()
-        if not patient:
-            return jsonify({'error': 'Patient not found'}), 404
-        
-        # Update fields
-        updated_observation = FHIRMapper.fhir_to_observation(fhir_observation, patient.id, observation.report_id)
+        patient_fhir_id = _subject_fhir_id(fhir_observation)
+        if not patient_fhir_id:
+            return fhir_response({'error': 'Invalid patient reference'}, 400)
         
-        # Preserve the original ID
-        updated_observation.id = observation.id
-        updated_observation.fhir_id = observation_id
+        patient_id = db.session.scalar(select(Patient.id).where(Patient.fhir_id == patient_fhir_id))
+        if not patient_id:
+            return fhir_response({'error': 'Patient not found'}, 404)
         
-        db.session.merge(updated_observation)
+        # Update fields in place; the original ids and report are kept
+        FHIRMapper.apply_observation_update(observation, fhir_observation, patient_id)
         db.session.commit()
         
-        fhir_observation_response = FHIRMapper.observation_to_fhir(updated_observation)
-        return jsonify(fhir_observation_response), 200
+        fhir_observation_response = FHIRMapper.observation_to_fhir(observation, patient_fhir_id)
+        return fhir_response(fhir_observation_response, 200)
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': str(e)}), 400
+        return fhir_response({'error': str(e)}, 400)
 
 
-@bp.route('/Observation/<string:observation_id>', methods=['DELETE'])
 @jwt_required()
 def delete_observation(observation_id):
     observation = Observation.query.filter_by(fhir_id=observation_id).first_or_404()
@@ -310,29 +405,34 @@ def delete_observation(observation_id):
     return '', 204
 
 
-@bp.route('/DiagnosticReport', methods=['GET'])
 @jwt_required()
+@cached_response(
+    'fhir-reports', ttl=TTL_NORMAL, resolve_patient=_searched_patient, mimetype='application/fhir+json'
+)
 def search_reports():
     patient_id = request.args.get('patient')
     
-    query = TestReport.query
+    query = TestReport.query.options(*load_options(
+        selectinload(TestReport.patient).lazyload('*'),
+    ))
     
     if patient_id:
         # Handle both internal ID and FHIR ID
-        patient = Patient.query.filter(
-            (Patient.id == patient_id) | (Patient.fhir_id == patient_id)
-        ).first()
-        if patient:
-            query = query.filter(TestReport.patient_id == patient.id)
-    
-    # Apply pagination
-    page = request.args.get('page', 1, type=int)
-    count = min(request.args.get('_count', 20, type=int), 100)
+        resolved_id = _resolve_patient_id(patient_id)
+        if resolved_id:
+            query = query.filter(TestReport.patient_id == resolved_id)
     
-    reports = query.paginate(page=page, per_page=count, error_out=False)
+    # Apply keyset pagination: `_cursor` continues after the previous page
+    count = min(request.args.get('_count', 20, type=int), 100)
+    try:
+        reports, next_cursor = keyset_page(
+            query, (TestReport.effective_datetime, TestReport.id), request.args.get('_cursor'), count
+        )
+    except ValueError as e:
+        return fhir_response({'error': str(e)}, 400)
     
     entries = []
-    for report in reports.items:
+    for report in reports:
         fhir_report = FHIRMapper.report_to_fhir(report)
         entries.append({
             "fullUrl": f"/fhir/DiagnosticReport/{report.fhir_id}",
@@ -342,273 +442,297 @@ def search_reports():
     bundle = {
         "resourceType": "Bundle",
         "type": "searchset",
-        "total": reports.total,
         "entry": entries,
-        "link": [
-            {
-                "relation": "self",
-                "url": request.url
-            }
-        ]
+        "link": _search_links(next_cursor)
     }
     
-    return jsonify(bundle), 200
+    return fhir_response(bundle, 200)
 
 
-@bp.route('/DiagnosticReport/<string:report_id>', methods=['GET'])
 @jwt_required()
+@cached_response(
+    'fhir-report', ttl=TTL_NORMAL, resolve_patient=_patient_of(TestReport, TestReport.patient_id, 'report_id'), mimetype='application/fhir+json'
+)
 def get_report(report_id):
-    report = TestReport.query.filter_by(fhir_id=report_id).first_or_404()
+    report = TestReport.query.options(*_report_load_options()).filter_by(fhir_id=report_id).first_or_404()
     fhir_report = FHIRMapper.report_to_fhir(report)
-    return jsonify(fhir_report), 200
+    return fhir_response(fhir_report, 200)
 
 
-@bp.route('/DiagnosticReport', methods=['POST'])
 @jwt_required()
 def create_report():
     try:
         fhir_report = request.get_json()
         
         # Extract patient ID from reference
-        subject_ref = fhir_report.get('subject', {}).get('reference', '')
-        if not subject_ref.startswith('Patient/'):
-            return jsonify({'error': 'Invalid patient reference'}), 400
+        patient_fhir_id = _subject_fhir_id(fhir_report)
+        if not patient_fhir_id:
+            return fhir_response({'error': 'Invalid patient reference'}, 400)
         
-        patient_fhir_id = subject_ref.split('/')[1]
-        patient = Patient.query.filter_by(fhir_id=patient_fhir_id).first()
-        if not patient:
-            return jsonify({'error': 'Patient not found'}), 404
+        patient_id = db.session.scalar(select(Patient.id).where(Patient.fhir_id == patient_fhir_id))
+        if not patient_id:
+            return fhir_response({'error': 'Patient not found'}, 404)
         
-        new_report = FHIRMapper.fhir_to_report(fhir_report, patient.id)
+        new_report = FHIRMapper.fhir_to_report(fhir_report, patient_id)
         
         db.session.add(new_report)
         db.session.commit()
         
-        fhir_report_response = FHIRMapper.report_to_fhir(new_report)
-        return jsonify(fhir_report_response), 201
+        fhir_report_response = FHIRMapper.report_to_fhir(new_report, patient_fhir_id)
+        return fhir_response(fhir_report_response, 201)
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': str(e)}), 400
+        return fhir_response({'error': str(e)}, 400)
 
 
-@bp.route('/DiagnosticReport/<string:report_id>', methods=['PUT'])
 @jwt_required()
 def update_report(report_id):
-    report = TestReport.query.filter_by(fhir_id=report_id).first_or_404()
+    report = TestReport.query.options(*_report_load_options()).filter_by(fhir_id=report_id).first_or_404()
     
     try:
         fhir_report = request.get_json()
         
         # Extract patient ID from reference
-        subject_ref = fhir_report.get('subject', {}).get('reference', '')
-        if not subject_ref.startswith('Patient/'):
-            return jsonify({'error': 'Invalid patient reference'}), 400
+        patient_fhir_id = _subject_fhir_id(fhir_report)
+        if not patient_fhir_id:
+            return fhir_response({'error': 'Invalid patient reference'}, 400)
         
-        patient_fhir_id = subject_ref.split('/')[1]
-        patient = Patient.query.filter_by(fhir_id=patient_fhir_id).first()
-        if not patient:
-            return jsonify({'error': 'Patient not found'}), 404
-        
-        # Update fields
-        updated_report = FHIRMapper.fhir_to_report(fhir_report, patient.id)
+        patient_id = db.session.scalar(select(Patient.id).where(Patient.fhir_id == patient_fhir_id))
+        if not patient_id:
+            return fhir_response({'error': 'Patient not found'}, 404)
         
-        # Preserve the original ID
-        updated_report.id = report.id
-        updated_report.fhir_id = report_id
-        updated_report.patient_id = report.patient_id  # Don't change patient association
-        
-        db.session.merge(updated_report)
+        # Update fields in place; the original ids and patient association are kept
+        FHIRMapper.apply_report_update(report, fhir_report)
         db.session.commit()
         
-        fhir_report_response = FHIRMapper.report_to_fhir(updated_report)
-        return jsonify(fhir_report_response), 200
+        fhir_report_response = FHIRMapper.report_to_fhir(report)
+        return fhir_response(fhir_report_response, 200)
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': str(e)}), 400
+        return fhir_response({'error': str(e)}, 400)
 
 
-@bp.route('/DiagnosticReport/<string:report_id>', methods=['DELETE'])
 @jwt_required()
 def delete_report(report_id):
     report = TestReport.query.filter_by(fhir_id=report_id).first_or_404()
     
-    # Delete related observations first due to foreign key constraints
-    Observation.query.filter_by(report_id=report.id).delete()
-    
-    db.session.delete(report)
+    delete_report_cascade(report)
     db.session.commit()
     
     return '', 204
 
 
-@bp.route('/Bundle', methods=['GET'])
+# Rows fetched per round trip while streaming a Bundle
+BUNDLE_YIELD_PER = 200
+
+
+def _stream_bundle(bundle_type, resources):
+    """Serialize a Bundle incrementally, one entry at a time, as JSON byte chunks"""
+    yield b'{"resourceType":"Bundle","type":' + dumps_fhir(bundle_type) + b',"entry":['
+    separator = b''
+    for resource in resources:
+        entry = FHIRMapper.bundle_entry(resource)
+        if entry is not None:
+            yield separator + dumps_fhir(entry)
+            separator = b','
+    yield b']}'
+
+
 @jwt_required()
 def get_bundle():
+    """
+    Export a patient with all their observations and reports as a Bundle.
+    The response is streamed: rows are fetched in batches and each entry is
+    serialized as it is produced, so memory stays flat for large records.
+    """
     patient_id = request.args.get('patient')
     bundle_type = request.args.get('type', 'collection')
     
     if not patient_id:
-        return jsonify({'error': 'Patient ID is required'}), 400
+        return fhir_response({'error': 'Patient ID is required'}, 400)
     
-    # Handle both internal ID and FHIR ID
-    patient = Patient.query.filter(
-        (Patient.id == patient_id) | (Patient.fhir_id == patient_id)
-    ).first()
+    # Handle both internal ID and FHIR ID; the patient's collections are
+    # streamed below rather than loaded with it
+    resolved_id = _resolve_patient_id(patient_id)
+    patient = resolved_id and db.session.get(Patient, resolved_id, options=load_options(lazyload('*')))
     if not patient:
-        return jsonify({'error': 'Patient not found'}), 404
-    
-    # Get all related resources for this patient
-    fhir_resources = []
-    
-    # Add patient
-    fhir_resources.append(FHIRMapper.patient_to_fhir(patient))
-    
-    # Add all observations for this patient
-    observations = Observation.query.filter_by(patient_id=patient.id).all()
-    for obs in observations:
-        fhir_resources.append(FHIRMapper.observation_to_fhir(obs))
-    
-    # Add all reports for this patient
-    reports = TestReport.query.filter_by(patient_id=patient.id).all()
-    for rep in reports:
-        fhir_resources.append(FHIRMapper.report_to_fhir(rep))
-    
-    # Create bundle
-    bundle = FHIRMapper.create_bundle(fhir_resources, bundle_type)
-    
-    return jsonify(bundle), 200
+        return fhir_response({'error': 'Patient not found'}, 404)
+    
+    def resources():
+        # Add patient
+        yield FHIRMapper.patient_to_fhir(patient)
+        
+        # Add all observations for this patient
+        observations = _observation_rows().filter(
+            Observation.patient_id == patient.id
+        ).order_by(Observation.id).yield_per(BUNDLE_YIELD_PER)
+        for row in observations:
+            yield FHIRMapper.observation_row_to_fhir(row)
+        
+        # Add all reports for this patient, as plain column rows
+        reports = db.session.query(*TestReport.__table__.c).filter(
+            TestReport.patient_id == patient.id
+        ).order_by(TestReport.id).yield_per(BUNDLE_YIELD_PER)
+        for row in reports:
+            yield FHIRMapper.report_row_to_fhir(row, patient.fhir_id)
+    
+    return current_app.response_class(
+        stream_with_context(_stream_bundle(bundle_type, resources())), mimetype='application/fhir+json'
+    )
+
+
+# Columns written by a bundle import for each resource type
+PATIENT_IMPORT_FIELDS = ('name', 'birth_date', 'gender', 'notes')
+REPORT_IMPORT_FIELDS = ('patient_id', 'effective_datetime', 'status', 'category', 'conclusion', 'conclusion_code')
+OBSERVATION_IMPORT_FIELDS = (
+    'patient_id', 'report_id', 'biomarker_id', 'effective_datetime', 'value', 'status', 'category',
+    'unit', 'ref_min', 'ref_max', 'interpretation', 'notes', 'performer', 'specimen', 'method'
+)
+
+
+def _rows_by_fhir_id(model, fhir_ids, *columns):
+    """Fetch `columns` for every row whose fhir_id is in `fhir_ids`, in one IN query"""
+    fhir_ids = {fhir_id for fhir_id in fhir_ids if fhir_id}
+    if not fhir_ids:
+        return {}
+    rows = db.session.execute(select(model.fhir_id, *columns).where(model.fhir_id.in_(fhir_ids)))
+    return {row.fhir_id: row for row in rows}
+
+
+def _import_row(obj, fields):
+    """Column values of a mapped FHIR resource; fhir_id is left out when not given so the default applies"""
+    row = {field: getattr(obj, field) for field in fields}
+    if obj.fhir_id:
+        row['fhir_id'] = obj.fhir_id
+    return row
+
+
+def _split_upserts(rows, existing):
+    """
+    Split import rows into inserts and primary-key updates of existing rows.
+    A fhir_id repeated within the bundle keeps its last values.
+    """
+    new_rows, updated_rows = {}, {}
+    for row in rows:
+        match = existing.get(row.get('fhir_id'))
+        if match is not None:
+            updated_rows[match.id] = {**row, 'id': match.id}
+        else:
+            new_rows[row.get('fhir_id') or len(new_rows)] = row
+    return list(new_rows.values()), list(updated_rows.values())
 
 
-@bp.route('/Bundle', methods=['POST'])
 @jwt_required()
 def post_bundle():
-    """Import a complete patient bundle"""
+    """
+    Import a complete patient bundle.
+    Entries are grouped by resource type; existing rows are looked up with
+    one IN query per type and written back with bulk INSERT/UPDATE
+    statements instead of per-entry queries and ORM flushes.
+    """
     try:
         bundle = request.get_json()
         
         if bundle.get('resourceType') != 'Bundle':
-            return jsonify({'error': 'Resource is not a Bundle'}), 400
-        
-        entries = bundle.get('entry', [])
+            return fhir_response({'error': 'Resource is not a Bundle'}, 400)
         
-        imported_resources = []
-        
-        for entry in entries:
+        resources = {'Patient': [], 'DiagnosticReport': [], 'Observation': []}
+        for entry in bundle.get('entry', []):
             resource = entry.get('resource')
-            if not resource:
-                continue
-                
-            resource_type = resource.get('resourceType')
-            
-            if resource_type == 'Patient':
-                # Create or update patient
-                patient = FHIRMapper.fhir_to_patient(resource)
-                
-                # Check if patient already exists
-                existing_patient = Patient.query.filter_by(fhir_id=resource.get('id')).first()
-                if existing_patient:
-                    # Update existing patient
-                    existing_patient.name = patient.name
-                    existing_patient.birth_date = patient.birth_date
-                    existing_patient.gender = patient.gender
-                    existing_patient.notes = patient.notes
-                    db.session.merge(existing_patient)
-                    imported_resources.append(existing_patient)
-                else:
-                    # Add new patient
-                    db.session.add(patient)
-                    imported_resources.append(patient)
-            
-            elif resource_type == 'DiagnosticReport':
-                # Find the patient first
-                subject_ref = resource.get('subject', {}).get('reference', '')
-                if not subject_ref.startswith('Patient/'):
-                    continue
-                    
-                patient_fhir_id = subject_ref.split('/')[1]
-                patient = Patient.query.filter_by(fhir_id=patient_fhir_id).first()
-                if not patient:
-                    continue
-                
-                # Create report
-                report = FHIRMapper.fhir_to_report(resource, patient.id)
-                
-                # Check if report already exists
-                existing_report = TestReport.query.filter_by(fhir_id=resource.get('id')).first()
-                if existing_report:
-                    # Update existing report
-                    existing_report.patient_id = patient.id
-                    existing_report.effective_datetime = report.effective_datetime
-                    existing_report.status = report.status
-                    existing_report.category = report.category
-                    existing_report.conclusion = report.conclusion
-                    existing_report.conclusion_code = report.conclusion_code
-                    db.session.merge(existing_report)
-                    imported_resources.append(existing_report)
-                else:
-                    # Add new report
-                    db.session.add(report)
-                    imported_resources.append(report)
-            
-            elif resource_type == 'Observation':
-                # Find the patient first
-                subject_ref = resource.get('subject', {}).get('reference', '')
-                if not subject_ref.startswith('Patient/'):
-                    continue
-                    
-                patient_fhir_id = subject_ref.split('/')[1]
-                patient = Patient.query.filter_by(fhir_id=patient_fhir_id).first()
-                if not patient:
-                    continue
-                
-                # Find the report for this observation
-                # For simplicity, we'll create a basic report if one doesn't exist
-                # In a real implementation, this would be handled differently
-                report = TestReport.query.filter_by(patient_id=patient.id).first()
-                if not report:
-                    report = TestReport(
-                        patient_id=patient.id,
-                        effective_datetime=datetime.now(),
-                        status="final",
-                        category="laboratory"
-                    )
-                    db.session.add(report)
-                
-                # Create observation
-                observation = FHIRMapper.fhir_to_observation(resource, patient.id, report.id)
-                
-                # Check if observation already exists
-                existing_observation = Observation.query.filter_by(fhir_id=resource.get('id')).first()
-                if existing_observation:
-                    # Update existing observation
-                    existing_observation.patient_id = patient.id
-                    existing_observation.report_id = report.id
-                    existing_observation.biomarker_id = observation.biomarker_id
-                    existing_observation.effective_datetime = observation.effective_datetime
-                    existing_observation.value = observation.value
-                    existing_observation.status = observation.status
-                    existing_observation.category = observation.category
-                    existing_observation.unit = observation.unit
-                    existing_observation.ref_min = observation.ref_min
-                    existing_observation.ref_max = observation.ref_max
-                    existing_observation.interpretation = observation.interpretation
-                    existing_observation.notes = observation.notes
-                    existing_observation.performer = observation.performer
-                    existing_observation.specimen = observation.specimen
-                    existing_observation.method = observation.method
-                    db.session.merge(existing_observation)
-                    imported_resources.append(existing_observation)
-                else:
-                    # Add new observation
-                    db.session.add(observation)
-                    imported_resources.append(observation)
+            if resource and resource.get('resourceType') in resources:
+                resources[resource['resourceType']].append(resource)
+        
+        imported_count = 0
+        changed_patient_ids = set()
+        
+        # Patients
+        patient_rows = [_import_row(FHIRMapper.fhir_to_patient(r), PATIENT_IMPORT_FIELDS) for r in resources['Patient']]
+        existing = _rows_by_fhir_id(Patient, (row.get('fhir_id') for row in patient_rows), Patient.id)
+        new_rows, updated_rows = _split_upserts(patient_rows, existing)
+        bulk_insert_rows(Patient, new_rows)
+        if updated_rows:
+            db.session.execute(update(Patient), updated_rows)
+        changed_patient_ids.update(row['id'] for row in updated_rows)
+        imported_count += len(patient_rows)
+        
+        # Resolve every referenced patient (including those just inserted) once
+        patients = _rows_by_fhir_id(
+            Patient,
+            (_subject_fhir_id(r) for r in resources['DiagnosticReport'] + resources['Observation']),
+            Patient.id
+        )
         
+        # Diagnostic reports
+        report_rows = []
+        for resource in resources['DiagnosticReport']:
+            patient = patients.get(_subject_fhir_id(resource))
+            if patient is None:
+                continue
+            report_rows.append(_import_row(FHIRMapper.fhir_to_report(resource, patient.id), REPORT_IMPORT_FIELDS))
+        existing = _rows_by_fhir_id(
+            TestReport, (row.get('fhir_id') for row in report_rows), TestReport.id, TestReport.patient_id
+        )
+        new_rows, updated_rows = _split_upserts(report_rows, existing)
+        bulk_insert_rows(TestReport, new_rows)
+        if updated_rows:
+            db.session.execute(update(TestReport), updated_rows)
+        changed_patient_ids.update(row['patient_id'] for row in report_rows)
+        changed_patient_ids.update(existing[row['fhir_id']].patient_id for row in updated_rows)
+        imported_count += len(report_rows)
+        
+        # Observations are attached to one of the patient's reports; patients
+        # without any report get a basic one
+        observation_resources = [
+            (resource, patients[_subject_fhir_id(resource)]) for resource in resources['Observation']
+            if _subject_fhir_id(resource) in patients
+        ]
+        observation_patient_ids = {patient.id for _, patient in observation_resources}
+        report_ids = _first_report_ids(observation_patient_ids)
+        missing = observation_patient_ids - report_ids.keys()
+        if missing:
+            bulk_insert_rows(TestReport, [
+                {'patient_id': patient_id, 'effective_datetime': datetime.now(), 'status': 'final', 'category': 'laboratory'}
+                for patient_id in missing
+            ])
+            report_ids.update(_first_report_ids(missing))
+        
+        observation_rows = [
+            _import_row(
+                FHIRMapper.fhir_to_observation(resource, patient.id, report_ids[patient.id]),
+                OBSERVATION_IMPORT_FIELDS
+            )
+            for resource, patient in observation_resources
+        ]
+        existing = _rows_by_fhir_id(
+            Observation, (row.get('fhir_id') for row in observation_rows), Observation.id, Observation.patient_id
+        )
+        new_rows, updated_rows = _split_upserts(observation_rows, existing)
+        bulk_insert_observations(new_rows)
+        if updated_rows:
+            db.session.execute(update(Observation), updated_rows)
+        changed_patient_ids.update(row['patient_id'] for row in updated_rows)
+        changed_patient_ids.update(existing[row['fhir_id']].patient_id for row in updated_rows)
+        imported_count += len(observation_rows)
+        
+        mark_patients_changed(db.session, changed_patient_ids)
         db.session.commit()
         
-        return jsonify({
-            'message': f'Successfully imported {len(imported_resources)} resources',
-            'resources_imported': len(imported_resources)
-        }), 201
+        return fhir_response({
+            'message': f'Successfully imported {imported_count} resources',
+            'resources_imported': imported_count
+        }, 201)
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': str(e)}), 400
\ No newline at end of file
+        return fhir_response({'error': str(e)}, 400)
+
+
+def _first_report_ids(patient_ids):
+    """Map each patient id to the id of its first report, in one grouped query"""
+    if not patient_ids:
+        return {}
+    rows = db.session.execute(
+        select(TestReport.patient_id, func.min(TestReport.id))
+        .where(TestReport.patient_id.in_(patient_ids))
+        .group_by(TestReport.patient_id)
+    )
+    return dict(rows.all())
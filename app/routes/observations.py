@@ -1,13 +1,13 @@
-from flask import Blueprint, request, jsonify
+from flask import request, jsonify
 from flask_jwt_extended import jwt_required
-from app.models import Observation, Patient, TestReport, Biomarker
-from app.schemas import ObservationCreate, ObservationUpdate, ObservationResponse
+from app.models import Observation, Patient, TestReport, Biomarker, record_exists
+from app.schemas import ObservationCreate, ObservationUpdate, ObservationResponse, response_columns
 from app import db
+from app.routes._crud import update_resource
+from app.pagination import keyset_page
+from app.services.fhir_mapper import parse_fhir_datetime
 
-bp = Blueprint('observations', __name__, url_prefix='/api/v1/observations')
 
-
-@bp.route('', methods=['GET'])
 @jwt_required()
 def get_observations():
     patient_id = request.args.get('patient', type=int)
@@ -15,7 +15,8 @@ def get_observations():
     date_from = request.args.get('date_ge')  # FHIR-style date filtering: ge=date
     date_to = request.args.get('date_le')    # FHIR-style date filtering: le=date
     
-    query = Observation.query
+    # Plain rows of the response columns; skip ORM hydration and per-row schema models
+    query = db.session.query(*response_columns(Observation.__table__, ObservationResponse))
     
     if patient_id:
         query = query.filter_by(patient_id=patient_id)
@@ -27,58 +28,49 @@ def get_observations():
         )
     
     if date_from:
-        from datetime import datetime
-        date_from_obj = datetime.fromisoformat(date_from.replace('Z', '+00:00'))
+        date_from_obj = parse_fhir_datetime(date_from)
         query = query.filter(Observation.effective_datetime >= date_from_obj)
     
     if date_to:
-        from datetime import datetime
-        date_to_obj = datetime.fromisoformat(date_to.replace('Z', '+00:00'))
+        date_to_obj = parse_fhir_datetime(date_to)
         query = query.filter(Observation.effective_datetime <= date_to_obj)
     
-    # Apply pagination
-    page = request.args.get('page', 1, type=int)
+    # Apply keyset pagination: `cursor` continues after the previous page
     per_page = min(request.args.get('per_page', 20, type=int), 100)
-    
-    observations = query.paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    try:
+        observations, next_cursor = keyset_page(
+            query, (Observation.effective_datetime, Observation.id), request.args.get('cursor'), per_page
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     return jsonify({
-        'observations': [ObservationResponse.from_orm(obs).dict() for obs in observations.items],
-        'total': observations.total,
-        'pages': observations.pages,
-        'current_page': page
+        'observations': [row._asdict() for row in observations],
+        'next_cursor': next_cursor
     }), 200
 
 
-@bp.route('/<int:observation_id>', methods=['GET'])
 @jwt_required()
 def get_observation(observation_id):
     observation = Observation.query.get_or_404(observation_id)
     return jsonify(ObservationResponse.from_orm(observation).dict()), 200
 
 
-@bp.route('', methods=['POST'])
 @jwt_required()
 def create_observation():
     try:
-        data = request.get_json()
-        observation_data = ObservationCreate(**data)
+        observation_data = ObservationCreate.model_validate_json(request.get_data())
         
         # Verify patient exists
-        patient = Patient.query.get(observation_data.patient_id)
-        if not patient:
+        if not record_exists(Patient, observation_data.patient_id):
             return jsonify({'error': 'Patient not found'}), 404
         
         # Verify report exists
-        report = TestReport.query.get(observation_data.report_id)
-        if not report:
+        if not record_exists(TestReport, observation_data.report_id):
             return jsonify({'error': 'Report not found'}), 404
         
         # Verify biomarker exists
-        biomarker = Biomarker.query.get(observation_data.biomarker_id)
-        if not biomarker:
+        if not record_exists(Biomarker, observation_data.biomarker_id):
             return jsonify({'error': 'Biomarker not found'}), 404
         
         observation = Observation(
@@ -108,27 +100,11 @@ def create_observation():
         return jsonify({'error': str(e)}), 400
 
 
-@bp.route('/<int:observation_id>', methods=['PUT'])
 @jwt_required()
 def update_observation(observation_id):
-    observation = Observation.query.get_or_404(observation_id)
-    
-    try:
-        data = request.get_json()
-        observation_update = ObservationUpdate(**data)
-        
-        for field, value in observation_update.dict(exclude_unset=True).items():
-            setattr(observation, field, value)
-        
-        db.session.commit()
-        
-        return jsonify(ObservationResponse.from_orm(observation).dict()), 200
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': str(e)}), 400
+    return update_resource(Observation, observation_id, ObservationUpdate, ObservationResponse, 'Observation')
 
 
-@bp.route('/<int:observation_id>', methods=['DELETE'])
 @jwt_required()
 def delete_observation(observation_id):
     observation = Observation.query.get_or_404(observation_id)
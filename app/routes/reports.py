@@ -1,54 +1,60 @@
-from flask import Blueprint, request, jsonify
+from flask import request, jsonify
 from flask_jwt_extended import jwt_required
-from app.models import TestReport, Patient, Observation
-from app.schemas import TestReportCreate, TestReportUpdate, TestReportResponse
+from app.models import TestReport, delete_report_cascade, is_foreign_key_violation
+from app.schemas import TestReportCreate, TestReportUpdate, TestReportResponse, response_columns
 from app import db
+from app.routes._crud import update_resource
+from sqlalchemy.exc import IntegrityError
+from app.pagination import keyset_page, requested_fields
+from app.json_provider import json_response
 
-bp = Blueprint('reports', __name__, url_prefix='/api/v1/reports')
 
-
-@bp.route('', methods=['GET'])
 @jwt_required()
 def get_reports():
     patient_id = request.args.get('patient', type=int)
-    page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('_count', 20, type=int), 100)  # Using FHIR-style _count
     
-    query = TestReport.query
-    
-    if patient_id:
-        query = query.filter_by(patient_id=patient_id)
-    
-    reports = query.paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    try:
+        # Optional projection, e.g. ?fields=effective_datetime,status (id is always included)
+        fields = requested_fields(request.args.get('fields'), TestReportResponse.model_fields)
+        
+        # Plain rows of the response columns; skip ORM hydration and per-row
+        # schema models. The sort key is selected even when not requested
+        names = fields or list(TestReportResponse.model_fields)
+        query = db.session.query(*response_columns(
+            TestReport.__table__, TestReportResponse, list(dict.fromkeys((*names, 'effective_datetime')))
+        ))
+        
+        if patient_id:
+            query = query.filter(TestReport.patient_id == patient_id)
+        
+        # Keyset pagination: `cursor` continues after the previous page
+        reports, next_cursor = keyset_page(
+            query, (TestReport.effective_datetime, TestReport.id), request.args.get('cursor'), per_page
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify({
-        'reports': [TestReportResponse.from_orm(r).dict() for r in reports.items],
-        'total': reports.total,
-        'pages': reports.pages,
-        'current_page': page
-    }), 200
+    body = {
+        'reports': [{name: getattr(row, name) for name in names} for row in reports],
+        'next_cursor': next_cursor
+    }
+    # The total costs a COUNT over every matching row, so only on request
+    if request.args.get('include_total', type=int):
+        body['total'] = query.order_by(None).count()
+    return json_response(body)
 
 
-@bp.route('/<int:report_id>', methods=['GET'])
 @jwt_required()
 def get_report(report_id):
     report = TestReport.query.get_or_404(report_id)
     return jsonify(TestReportResponse.from_orm(report).dict()), 200
 
 
-@bp.route('', methods=['POST'])
 @jwt_required()
 def create_report():
     try:
-        data = request.get_json()
-        report_data = TestReportCreate(**data)
-        
-        # Verify patient exists
-        patient = Patient.query.get(report_data.patient_id)
-        if not patient:
-            return jsonify({'error': 'Patient not found'}), 404
+        report_data = TestReportCreate.model_validate_json(request.get_data())
         
         report = TestReport(
             patient_id=report_data.patient_id,
@@ -63,41 +69,27 @@ def create_report():
         db.session.commit()
         
         return jsonify(TestReportResponse.from_orm(report).dict()), 201
+    except IntegrityError as e:
+        # The patient is checked by the foreign key instead of a separate lookup
+        db.session.rollback()
+        if is_foreign_key_violation(e):
+            return jsonify({'error': 'Patient not found'}), 404
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
 
-@bp.route('/<int:report_id>', methods=['PUT'])
 @jwt_required()
 def update_report(report_id):
-    report = TestReport.query.get_or_404(report_id)
-    
-    try:
-        data = request.get_json()
-        report_update = TestReportUpdate(**data)
-        
-        for field, value in report_update.dict(exclude_unset=True).items():
-            setattr(report, field, value)
-        
-        db.session.commit()
-        
-        return jsonify(TestReportResponse.from_orm(report).dict()), 200
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': str(e)}), 400
+    return update_resource(TestReport, report_id, TestReportUpdate, TestReportResponse, 'Report')
 
 
-@bp.route('/<int:report_id>', methods=['DELETE'])
 @jwt_required()
 def delete_report(report_id):
     report = TestReport.query.get_or_404(report_id)
     
-    # Delete related observations first due to foreign key constraints
-    Observation.query.filter_by(report_id=report_id).delete()
-    
-    # Then delete the report
-    db.session.delete(report)
+    delete_report_cascade(report)
     db.session.commit()
     
     return jsonify({'message': 'Report deleted successfully'}), 200
\ No newline at end of file
@@ -1,8 +1,9 @@
-from flask import Blueprint, request, jsonify, session
-from app.i18n import get_available_languages, get_text
+from flask import request, jsonify, session, g
+from app.i18n import LANGUAGE_CODES, get_available_languages, get_text
 from functools import wraps
 
-bp = Blueprint('settings', __name__)
+# Confirmation message per language, translated once
+_SETTINGS_SAVED = {lang: get_text('settings_saved', lang) for lang in LANGUAGE_CODES}
 
 def login_required(f):
     """Decorator to require valid session"""
@@ -14,7 +15,6 @@ def login_required(f):
     return decorated_function
 
 
-@bp.route('/api/v1/settings/language', methods=['GET'])
 @login_required
 def get_language():
     """Get current language setting"""
@@ -25,29 +25,27 @@ def get_language():
     })
 
 
-@bp.route('/api/v1/settings/language', methods=['POST'])
 @login_required
 def set_language():
     """Set language preference"""
     data = request.get_json()
     lang = data.get('language')
     
-    if not lang or lang not in ['en', 'es']:
+    if not isinstance(lang, str) or lang not in LANGUAGE_CODES:
         return jsonify({'error': 'Invalid language code. Use "en" or "es"'}), 400
     
     session['language'] = lang
     return jsonify({
-        'message': get_text('settings_saved', lang),
+        'message': _SETTINGS_SAVED[lang],
         'language': lang
     })
 
 
-@bp.route('/api/v1/translate/<key>', methods=['GET'])
 @login_required
 def translate(key):
     """Translate a specific text key"""
     lang = session.get('language', 'en')
-    translated_text = get_text(key, lang)
+    translated_text = g.t(key)
     return jsonify({
         'original_key': key,
         'translated_text': translated_text,
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, ConfigDict, TypeAdapter, field_validator
 from typing import Optional, List
 from datetime import date, datetime
 import uuid
@@ -29,8 +29,7 @@ class PatientResponse(PatientBase):
     created_at: datetime
     updated_at: Optional[datetime] = None
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # LOINC Code Schemas
@@ -52,8 +51,7 @@ class LOINCCodeCreate(LOINCCodeBase):
 class LOINCCodeResponse(LOINCCodeBase):
     id: int
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # UCUM Unit Schemas
@@ -70,8 +68,7 @@ class UCUMUnitCreate(UCUMUnitBase):
 class UCUMUnitResponse(UCUMUnitBase):
     id: int
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # Biomarker Schemas
@@ -98,8 +95,7 @@ class BiomarkerUpdate(BaseModel):
 class BiomarkerResponse(BiomarkerBase):
     id: int
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # Test Report Schemas
@@ -127,8 +123,7 @@ class TestReportResponse(TestReportBase):
     fhir_id: str
     issued: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # Observation Schemas
@@ -171,8 +166,7 @@ class ObservationResponse(ObservationBase):
     id: int
     fhir_id: str
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # Medical Document Schemas
@@ -182,6 +176,7 @@ class MedicalDocumentBase(BaseModel):
     filepath: str
     file_type: str
     file_size: int
+    content_sha256: Optional[str] = None
     report_id: Optional[int] = None
     description: Optional[str] = None
 
@@ -195,8 +190,7 @@ class MedicalDocumentResponse(MedicalDocumentBase):
     fhir_id: str
     upload_date: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # User Schemas
@@ -222,8 +216,7 @@ class UserResponse(UserBase):
     created_at: datetime
     last_login: Optional[datetime] = None
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # Authentication Schemas
@@ -254,6 +247,8 @@ class AIConsultRequest(BaseModel):
     question: str
     provider: str = "mock"
     context_type: str = "fhir_bundle"  # fhir_bundle, text_summary, raw_data
+    stream: bool = False  # send the answer as server-sent events while it is generated
+    background: bool = False  # answer later through GET /consult/<job_id>
 
 
 class AIConsultResponse(BaseModel):
@@ -261,6 +256,8 @@ class AIConsultResponse(BaseModel):
     provider_used: str
     timestamp: datetime
 
+    model_config = ConfigDict(frozen=True)
+
 
 # Backup Schemas
 class BackupCreateRequest(BaseModel):
@@ -301,4 +298,22 @@ class TrendDataPoint(BaseModel):
 class TrendResponse(BaseModel):
     biomarker_name: str
     unit: Optional[str] = None
-    data_points: List[TrendDataPoint]
\ No newline at end of file
+    data_points: List[TrendDataPoint]
+
+
+# List adapters: validate and dump a whole page of ORM objects in one call
+MedicalDocumentListAdapter = TypeAdapter(List[MedicalDocumentResponse])
+
+
+def dump_orm_list(adapter, objects):
+    """Serialize ORM objects to dicts through a list TypeAdapter"""
+    return adapter.dump_python(adapter.validate_python(objects, from_attributes=True))
+
+
+def response_columns(table, model, names=None):
+    """
+    Columns of `table` backing a response schema's fields (or just `names`),
+    in field order. Rows selected from them already have the response shape,
+    so list endpoints emit them as dicts without building models.
+    """
+    return [table.c[name] for name in (names or model.model_fields)]
@@ -1,12 +1,25 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, List, Optional
+from functools import lru_cache
 import requests
-import openai
+from requests.adapters import HTTPAdapter
+import orjson
 from app import db
-from app.models import Patient, Observation, TestReport
+from sqlalchemy.orm import lazyload, selectinload
+from app.models import Patient, Observation, TestReport, load_options
 from app.services.fhir_mapper import FHIRMapper
 
 
+# Providers are created per request; one pooled session keeps connections to
+# the local LLM servers (Ollama, LM Studio) alive across requests
+_http = requests.Session()
+_http.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+_http.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+# (connect, read) timeouts for LLM server calls; generation can be slow
+LLM_TIMEOUT = (3, 120)
+
+
 class AIProvider(ABC):
     @abstractmethod
     def generate_response(self, prompt: str, context: Dict[str, Any]) -> str:
@@ -15,29 +28,51 @@ class AIProvider(ABC):
     @abstractmethod
     def get_name(self) -> str:
         pass
+    
+    def stream_response(self, prompt: str, context: Dict[str, Any]) -> Iterator[str]:
+        """Yield the response in chunks as it is generated; by default all at once"""
+        yield self.generate_response(prompt, context)
+
+
+@lru_cache(maxsize=4)
+def _openai_client(api_key: Optional[str]):
+    """OpenAI client per API key; each holds an HTTP connection pool reused across consults"""
+    import openai  # heavy SDK, only loaded when the OpenAI provider is used
+    return openai.OpenAI(api_key=api_key)
 
 
 class OpenAIProvider(AIProvider):
     def __init__(self, api_key: str, model: str = "gpt-3.5-turbo"):
         self.api_key = api_key
         self.model = model
-        openai.api_key = api_key
+    
+    def _create(self, prompt: str, **kwargs):
+        return _openai_client(self.api_key).chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": "Eres un asistente médico útil que ayuda a interpretar resultados de análisis clínicos. Proporciona información clara y precisa basada en los datos proporcionados. Recuerda que esta información es solo para fines informativos y no reemplaza la opinión médica profesional."},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=1000,
+            temperature=0.7,
+            **kwargs
+        )
     
     def generate_response(self, prompt: str, context: Dict[str, Any]) -> str:
         try:
-            response = openai.ChatCompletion.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "Eres un asistente médico útil que ayuda a interpretar resultados de análisis clínicos. Proporciona información clara y precisa basada en los datos proporcionados. Recuerda que esta información es solo para fines informativos y no reemplaza la opinión médica profesional."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=1000,
-                temperature=0.7
-            )
-            return response.choices[0].message['content'].strip()
+            response = self._create(prompt)
+            return response.choices[0].message.content.strip()
         except Exception as e:
             return f"Error generating response: {str(e)}"
     
+    def stream_response(self, prompt: str, context: Dict[str, Any]) -> Iterator[str]:
+        try:
+            for chunk in self._create(prompt, stream=True):
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            yield f"Error generating response: {str(e)}"
+    
     def get_name(self) -> str:
         return "OpenAI"
 
@@ -49,14 +84,14 @@ class OllamaProvider(AIProvider):
     
     def generate_response(self, prompt: str, context: Dict[str, Any]) -> str:
         try:
-            response = requests.post(
+            response = _http.post(
                 f"{self.base_url}/api/generate",
                 json={
                     "model": self.model,
                     "prompt": f"Eres un asistente médico útil que ayuda a interpretar resultados de análisis clínicos. Proporciona información clara y precisa basada en los datos proporcionados. Recuerda que esta información es solo para fines informativos y no reemplaza la opinión médica profesional.\n\n{prompt}",
                     "stream": False
                 },
-                headers={"Content-Type": "application/json"}
+                timeout=LLM_TIMEOUT
             )
             if response.status_code == 200:
                 return response.json()["response"].strip()
@@ -75,7 +110,7 @@ class LMStudioProvider(AIProvider):
     
     def generate_response(self, prompt: str, context: Dict[str, Any]) -> str:
         try:
-            response = requests.post(
+            response = _http.post(
                 f"{self.base_url}/v1/chat/completions",
                 json={
                     "model": "",  # LM Studio usually ignores this
@@ -86,7 +121,7 @@ class LMStudioProvider(AIProvider):
                     "max_tokens": 1000,
                     "temperature": 0.7
                 },
-                headers={"Content-Type": "application/json"}
+                timeout=LLM_TIMEOUT
             )
             if response.status_code == 200:
                 return response.json()["choices"][0]["message"]["content"].strip()
@@ -124,32 +159,56 @@ def get_ai_provider(provider_name: str, **kwargs) -> AIProvider:
         return MockProvider()
 
 
+def _fhir_context_version(patient_id: int) -> Optional[int]:
+    """
+    The patient's data_version, which every commit touching the patient,
+    its observations or its reports replaces. Returns None if the patient
+    does not exist.
+    """
+    return db.session.query(Patient.data_version).filter(Patient.id == patient_id).scalar()
+
+
 def generate_fhir_context(patient_id: int) -> Dict[str, Any]:
     """
     Generate FHIR-compliant context for AI consumption
     Returns bundle with Patient, Observations, DiagnosticReports
+    Results are cached per (patient_id, data version); a newer version
+    simply misses the cache, so no explicit invalidation is needed.
     """
-    # Get patient FHIR resource
-    patient = Patient.query.get(patient_id)
-    if not patient:
+    version = _fhir_context_version(patient_id)
+    if version is None:
         return {"error": "Patient not found"}
     
-    patient_fhir = FHIRMapper.patient_to_fhir(patient)
+    return _build_fhir_context(patient_id, version)
+
+
+def clear_fhir_context_cache():
+    """Drop this process's cached FHIR contexts, e.g. after the database was replaced"""
+    _build_fhir_context.cache_clear()
+
+
+@lru_cache(maxsize=256)
+def _build_fhir_context(patient_id: int, version: int) -> Dict[str, Any]:
+    """Build the FHIR context for a patient; `version` only serves as cache key"""
+    # Get patient FHIR resource; its collections are queried below instead
+    patient = db.session.get(Patient, patient_id, options=load_options(lazyload('*')))
+    if not patient:
+        return {"error": "Patient not found"}
     
-    # Get all observations FHIR resources
-    observations = Observation.query.filter_by(patient_id=patient_id).all()
+    # Get all observations; biomarkers in one extra query, the patient
+    # comes from the identity map
+    observations = Observation.query.options(
+        *load_options(selectinload(Observation.biomarker))
+    ).filter_by(patient_id=patient_id).all()
     observations_fhir = [FHIRMapper.observation_to_fhir(obs) for obs in observations]
     
-    # Get all diagnostic reports FHIR resources
-    reports = TestReport.query.filter_by(patient_id=patient_id).all()
-    reports_fhir = [FHIRMapper.report_to_fhir(report) for report in reports]
+    # Get all diagnostic reports
+    reports = TestReport.query.options(*load_options()).filter_by(patient_id=patient_id).all()
     
-    # Create bundle
-    bundle_entries = [
-        {"resource": patient_fhir},
-        *[{"resource": obs} for obs in observations_fhir],
-        *[{"resource": report} for report in reports_fhir]
-    ]
+    # Create bundle, wrapping each resource as it is added
+    bundle_entries = [{"resource": FHIRMapper.patient_to_fhir(patient)}]
+    bundle_entries.extend({"resource": obs} for obs in observations_fhir)
+    bundle_entries.extend({"resource": FHIRMapper.report_to_fhir(report)} for report in reports)
     
     bundle = {
         "resourceType": "Bundle",
@@ -157,37 +216,39 @@ def generate_fhir_context(patient_id: int) -> Dict[str, Any]:
         "entry": bundle_entries
     }
     
-    # Generate text summary
-    text_summary = generate_text_summary(bundle)
+    # Generate text summary from the observation resources already built
+    text_summary = generate_text_summary(observations_fhir)
     
     return {
         "fhir_bundle": bundle,
+        # Serialized once per cache entry so prompts don't re-stringify the bundle
+        "fhir_bundle_json": orjson.dumps(bundle).decode(),
         "text_summary": text_summary,
         "patient_id": patient_id
     }
 
 
-def generate_text_summary(bundle: Dict[str, Any]) -> str:
+def generate_text_summary(observations: List[Dict[str, Any]]) -> str:
     """
-    Generate human-readable summary from FHIR bundle
+    Generate human-readable summary from FHIR Observation resources
     Format: Biomarker | Date | Value | Unit | Reference Range | Interpretation
     """
-    summary = "RESUMEN ANALÍTICAS:\n\n"
-    
-    for entry in bundle.get("entry", []):
-        resource = entry.get("resource", {})
-        if resource.get("resourceType") == "Observation":
-            code = resource.get("code", {}).get("coding", [{}])[0].get("display", "Unknown")
-            date = resource.get("effectiveDateTime", "")
-            value = resource.get("valueQuantity", {}).get("value", "")
-            unit = resource.get("valueQuantity", {}).get("unit", "")
-            ref_range = resource.get("referenceRange", [{}])[0]
-            low = ref_range.get("low", {}).get("value", "")
-            high = ref_range.get("high", {}).get("value", "")
-            interpretation = ""
-            if resource.get("interpretation"):
-                interpretation = resource["interpretation"][0].get("coding", [{}])[0].get("display", "")
-            
-            summary += f"{code} | {date} | {value} {unit} | [{low}-{high}] | {interpretation}\n"
-    
-    return summary
\ No newline at end of file
+    lines = ["RESUMEN ANALÍTICAS:\n\n"]
+    append = lines.append
+    
+    for resource in observations:
+        get = resource.get
+        code = get("code", {}).get("coding", [{}])[0].get("display", "Unknown")
+        date = get("effectiveDateTime", "")
+        quantity = get("valueQuantity", {})
+        value = quantity.get("value", "")
+        unit = quantity.get("unit", "")
+        ref_range = (get("referenceRange") or [{}])[0]
+        low = ref_range.get("low", {}).get("value", "")
+        high = ref_range.get("high", {}).get("value", "")
+        interpretation = get("interpretation")
+        interpretation = interpretation[0].get("coding", [{}])[0].get("display", "") if interpretation else ""
+        
+        append(f"{code} | {date} | {value} {unit} | [{low}-{high}] | {interpretation}\n")
+    
+    return "".join(lines)
\ No newline at end of file
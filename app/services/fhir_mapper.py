@@ -1,6 +1,87 @@
 from datetime import datetime
+from functools import lru_cache
 from app.models import Patient, Observation, TestReport, Biomarker, LOINCCode, UCUMUnit
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
+from app.services.terminology import get_loinc, get_ucum
+
+
+@lru_cache(maxsize=1024)
+def parse_fhir_datetime(value: str) -> datetime:
+    """
+    Parse a FHIR dateTime or date string. A trailing 'Z' is read as UTC;
+    only then is the string rewritten, as fromisoformat does not accept it
+    before Python 3.11 (nor after a bare date). Memoized, since the
+    observations of one report in a Bundle share their effectiveDateTime
+    """
+    if value[-1:] == 'Z':
+        value = value[:-1] + '+00:00'
+    return datetime.fromisoformat(value)
+
+
+# Constant fragments shared by every resource the mapper builds; resources
+# are serialized as built, so these are never mutated
+_MRN_IDENTIFIER_TYPE = {
+    "coding": [
+        {
+            "system": "http://terminology.hl7.org/CodeSystem/v2-0203",
+            "code": "MR",
+            "display": "Medical Record Number"
+        }
+    ]
+}
+_SUBSETTED_META = {
+    "tag": [
+        {
+            "system": "http://terminology.hl7.org/CodeSystem/v3-ObservationValue",
+            "code": "SUBSETTED"
+        }
+    ]
+}
+_LAB_REPORT_CODE = {
+    "coding": [
+        {
+            "system": "http://loinc.org",
+            "code": "24323-8",
+            "display": "Laboratory studies (set)"
+        }
+    ],
+    "text": "Laboratory Results"
+}
+
+# Display text for observation interpretation codes
+_INTERPRETATION_DISPLAY = {
+    "H": "High",
+    "L": "Low",
+    "N": "Normal",
+    "A": "Abnormal",
+    "AA": "Critical abnormal"
+}
+
+
+@lru_cache(maxsize=256)
+def _coded_concepts(system: str, code: str, display: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Shared single-coding CodeableConcept list for low-cardinality codes
+    (categories, interpretations). The display defaults to the title-cased code.
+    """
+    if display is None:
+        display = code.title()
+    return [
+        {
+            "coding": [
+                {
+                    "system": system,
+                    "code": code,
+                    "display": display
+                }
+            ]
+        }
+    ]
+
+
+def _without_none(obj: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop the None values of a flat dict"""
+    return {k: v for k, v in obj.items() if v is not None}
 
 
 class FHIRMapper:
@@ -9,21 +90,37 @@ class FHIRMapper:
     @staticmethod
     def patient_to_fhir(patient: Patient) -> Dict[str, Any]:
         """Convert Patient model to FHIR Patient resource"""
+        fhir_patient = FHIRMapper._patient_resource(patient)
+        fhir_patient["note"] = [
+            {
+                "text": patient.notes
+            }
+        ] if patient.notes else []
+        
+        return fhir_patient
+
+    @staticmethod
+    def patient_to_fhir_summary(patient: Patient) -> Dict[str, Any]:
+        """
+        Convert Patient model to a summary FHIR Patient resource for search
+        results: notes are left out (so they need not be loaded) and the
+        resource is tagged as SUBSETTED
+        """
+        fhir_patient = FHIRMapper._patient_resource(patient)
+        fhir_patient["meta"] = _SUBSETTED_META
+        
+        return fhir_patient
+
+    @staticmethod
+    def _patient_resource(patient: Patient) -> Dict[str, Any]:
+        """Build the Patient resource fields shared by the full and summary forms"""
         fhir_patient = {
             "resourceType": "Patient",
             "id": patient.fhir_id,
             "identifier": [
                 {
                     "use": "usual",
-                    "type": {
-                        "coding": [
-                            {
-                                "system": "http://terminology.hl7.org/CodeSystem/v2-0203",
-                                "code": "MR",
-                                "display": "Medical Record Number"
-                            }
-                        ]
-                    },
+                    "type": _MRN_IDENTIFIER_TYPE,
                     "value": str(patient.id)
                 }
             ],
@@ -32,26 +129,18 @@ class FHIRMapper:
                     "use": "official",
                     "text": patient.name
                 }
-            ],
-            "gender": patient.gender.lower() if patient.gender else None,
-            "birthDate": patient.birth_date.isoformat() if patient.birth_date else None,
-            "note": [
-                {
-                    "text": patient.notes
-                }
-            ] if patient.notes else []
+            ]
         }
-        
-        # Remove None values
-        fhir_patient = {k: v for k, v in fhir_patient.items() if v is not None}
+        if patient.gender:
+            fhir_patient["gender"] = patient.gender.lower()
+        if patient.birth_date:
+            fhir_patient["birthDate"] = patient.birth_date.isoformat()
         
         return fhir_patient
 
     @staticmethod
     def fhir_to_patient(fhir_patient: Dict[str, Any]) -> Patient:
         """Convert FHIR Patient resource to Patient model"""
-        from app.models import Patient
-        
         # Extract fields from FHIR resource
         name_entry = fhir_patient.get("name", [{}])[0] if fhir_patient.get("name") else {}
         name = name_entry.get("text") or name_entry.get("family", "") + " " + name_entry.get("given", [""])[0]
@@ -59,7 +148,7 @@ class FHIRMapper:
         patient = Patient(
             name=name.strip() or "Unknown Patient",
             gender=fhir_patient.get("gender"),
-            birth_date=datetime.fromisoformat(fhir_patient["birthDate"]) if fhir_patient.get("birthDate") else None,
+            birth_date=parse_fhir_datetime(fhir_patient["birthDate"]) if fhir_patient.get("birthDate") else None,
             notes=fhir_patient.get("note", [{}])[0].get("text") if fhir_patient.get("note") else None
         )
         
@@ -70,103 +159,136 @@ class FHIRMapper:
         return patient
 
     @staticmethod
-    def observation_to_fhir(observation: Observation) -> Dict[str, Any]:
-        """Convert Observation model to FHIR Observation resource"""
-        # Get biomarker information
+    def observation_to_fhir(observation: Observation, patient_fhir_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Convert Observation model to FHIR Observation resource. Pass the
+        patient's fhir_id when the caller already has it, so the patient
+        need not be loaded.
+        """
         biomarker = observation.biomarker
-        loinc_code = biomarker.loinc if biomarker.loinc else None
-        unit_info = biomarker.unit if biomarker.unit else None
+        return FHIRMapper._observation_resource(
+            observation, biomarker.id, biomarker.name, biomarker.loinc_code_id, biomarker.ucum_unit_id,
+            patient_fhir_id or observation.patient.fhir_id
+        )
+
+    @staticmethod
+    def observation_row_to_fhir(row) -> Dict[str, Any]:
+        """
+        Convert a projected observation row to a FHIR Observation resource,
+        without hydrating ORM objects. The row carries the observations
+        table columns plus biomarker_name, loinc_code_id, ucum_unit_id and
+        patient_fhir_id.
+        """
+        return FHIRMapper._observation_resource(
+            row, row.biomarker_id, row.biomarker_name, row.loinc_code_id, row.ucum_unit_id, row.patient_fhir_id
+        )
+
+    @staticmethod
+    def _observation_resource(observation, biomarker_id: int, biomarker_name: str, loinc_code_id, ucum_unit_id,
+                              patient_fhir_id: str) -> Dict[str, Any]:
+        """Build a FHIR Observation resource from observation column values and its biomarker and patient"""
+        # Get biomarker information
+        loinc_code = get_loinc(loinc_code_id)
+        unit_info = get_ucum(ucum_unit_id)
+        
+        # Quantities share one unit, resolved (and stripped of None values)
+        # once per observation rather than once per quantity
+        unit_fields = _without_none({
+            "unit": observation.unit or (unit_info.display if unit_info else ""),
+            "system": unit_info.system if unit_info else "http://unitsofmeasure.org",
+            "code": observation.unit or (unit_info.code if unit_info else "")
+        })
         
+        def quantity(value):
+            return {"value": value, **unit_fields}
+        
+        # Optional elements are only added when present, so the resource
+        # needs no pass afterwards to drop empty values
         fhir_observation = {
             "resourceType": "Observation",
-            "id": observation.fhir_id,
-            "status": observation.status,
-            "category": [
-                {
-                    "coding": [
-                        {
-                            "system": "http://terminology.hl7.org/CodeSystem/observation-category",
-                            "code": observation.category,
-                            "display": observation.category.title()
-                        }
-                    ]
-                }
+            "id": observation.fhir_id
+        }
+        if observation.status is not None:
+            fhir_observation["status"] = observation.status
+        fhir_observation["category"] = _coded_concepts(
+            "http://terminology.hl7.org/CodeSystem/observation-category", observation.category
+        )
+        fhir_observation["code"] = {
+            "coding": [
+                _without_none({
+                    "system": loinc_code.system if loinc_code else "http://local/biomarkers",
+                    "code": loinc_code.code if loinc_code else f"local:{biomarker_id}",
+                    "display": loinc_code.display if loinc_code else biomarker_name
+                })
             ],
-            "code": {
-                "coding": [
-                    {
-                        "system": loinc_code.system if loinc_code else "http://local/biomarkers",
-                        "code": loinc_code.code if loinc_code else f"local:{biomarker.id}",
-                        "display": loinc_code.display if loinc_code else biomarker.name
-                    }
-                ],
-                "text": biomarker.name
-            },
-            "subject": {
-                "reference": f"Patient/{observation.patient.fhir_id}"
-            },
-            "effectiveDateTime": observation.effective_datetime.isoformat(),
-            "valueQuantity": {
-                "value": observation.value,
-                "unit": observation.unit or (unit_info.display if unit_info else ""),
-                "system": unit_info.system if unit_info else "http://unitsofmeasure.org",
-                "code": observation.unit or (unit_info.code if unit_info else "")
-            } if observation.value is not None else None,
-            "interpretation": [
-                {
-                    "coding": [
-                        {
-                            "system": "http://terminology.hl7.org/CodeSystem/v3-ObservationInterpretation",
-                            "code": observation.interpretation,
-                            "display": FHIRMapper._get_interpretation_display(observation.interpretation)
-                        }
-                    ]
-                }
-            ] if observation.interpretation else [],
-            "referenceRange": [
-                {
-                    "low": {
-                        "value": observation.ref_min,
-                        "unit": observation.unit or (unit_info.display if unit_info else ""),
-                        "system": unit_info.system if unit_info else "http://unitsofmeasure.org",
-                        "code": observation.unit or (unit_info.code if unit_info else "")
-                    } if observation.ref_min is not None else None,
-                    "high": {
-                        "value": observation.ref_max,
-                        "unit": observation.unit or (unit_info.display if unit_info else ""),
-                        "system": unit_info.system if unit_info else "http://unitsofmeasure.org",
-                        "code": observation.unit or (unit_info.code if unit_info else "")
-                    } if observation.ref_max is not None else None
-                }
-            ] if observation.ref_min is not None or observation.ref_max is not None else [],
-            "performer": [
-                {
-                    "display": observation.performer
-                }
-            ] if observation.performer else [],
-            "specimen": {
-                "display": observation.specimen
-            } if observation.specimen else None,
-            "method": {
-                "text": observation.method
-            } if observation.method else None,
-            "note": [
-                {
-                    "text": observation.notes
-                }
-            ] if observation.notes else []
+            "text": biomarker_name
         }
+        fhir_observation["subject"] = {
+            "reference": f"Patient/{patient_fhir_id}"
+        }
+        fhir_observation["effectiveDateTime"] = observation.effective_datetime.isoformat()
+        if observation.value is not None:
+            fhir_observation["valueQuantity"] = quantity(observation.value)
+        fhir_observation["interpretation"] = _coded_concepts(
+            "http://terminology.hl7.org/CodeSystem/v3-ObservationInterpretation",
+            observation.interpretation,
+            FHIRMapper._get_interpretation_display(observation.interpretation)
+        ) if observation.interpretation else []
+        
+        reference_range = {}
+        if observation.ref_min is not None:
+            reference_range["low"] = quantity(observation.ref_min)
+        if observation.ref_max is not None:
+            reference_range["high"] = quantity(observation.ref_max)
+        fhir_observation["referenceRange"] = [reference_range] if reference_range else []
         
-        # Remove None values recursively
-        fhir_observation = FHIRMapper._remove_none_values(fhir_observation)
+        fhir_observation["performer"] = [
+            {
+                "display": observation.performer
+            }
+        ] if observation.performer else []
+        if observation.specimen:
+            fhir_observation["specimen"] = {
+                "display": observation.specimen
+            }
+        if observation.method:
+            fhir_observation["method"] = {
+                "text": observation.method
+            }
+        fhir_observation["note"] = [
+            {
+                "text": observation.notes
+            }
+        ] if observation.notes else []
         
         return fhir_observation
 
     @staticmethod
     def fhir_to_observation(fhir_observation: Dict[str, Any], patient_id: int, report_id: int) -> Observation:
         """Convert FHIR Observation resource to Observation model"""
-        from app.models import Observation, Biomarker, LOINCCode
+        observation = Observation(
+            patient_id=patient_id,
+            report_id=report_id,
+            **FHIRMapper._observation_fields(fhir_observation)
+        )
         
+        # Use the existing fhir_id from the FHIR resource
+        if "id" in fhir_observation:
+            observation.fhir_id = fhir_observation["id"]
+        
+        return observation
+
+    @staticmethod
+    def apply_observation_update(observation: Observation, fhir_observation: Dict[str, Any], patient_id: int) -> Observation:
+        """Update a persistent Observation in place from a FHIR Observation resource, keeping its ids and report"""
+        observation.patient_id = patient_id
+        for field, value in FHIRMapper._observation_fields(fhir_observation).items():
+            setattr(observation, field, value)
+        return observation
+
+    @staticmethod
+    def _observation_fields(fhir_observation: Dict[str, Any]) -> Dict[str, Any]:
+        """Extract Observation column values from a FHIR Observation resource"""
         # Extract value information
         value_quantity = fhir_observation.get("valueQuantity", {})
         value = value_quantity.get("value")
@@ -204,11 +326,15 @@ class FHIRMapper:
         # For this implementation, we'll create a temporary biomarker if needed
         biomarker_id = 1  # Placeholder - in real implementation, find or create biomarker
         
-        observation = Observation(
-            patient_id=patient_id,
-            report_id=report_id,
+        # Optional narrative elements, each looked up once
+        notes = fhir_observation.get("note")
+        performers = fhir_observation.get("performer")
+        specimen = fhir_observation.get("specimen")
+        method = fhir_observation.get("method")
+        
+        return dict(
             biomarker_id=biomarker_id,
-            effective_datetime=datetime.fromisoformat(fhir_observation["effectiveDateTime"]),
+            effective_datetime=parse_fhir_datetime(fhir_observation["effectiveDateTime"]),
             value=value,
             status=fhir_observation.get("status", "unknown"),
             category=FHIRMapper._extract_category(fhir_observation),
@@ -216,84 +342,68 @@ class FHIRMapper:
             ref_min=ref_min,
             ref_max=ref_max,
             interpretation=interpretation,
-            notes=fhir_observation.get("note", [{}])[0].get("text") if fhir_observation.get("note") else None,
-            performer=fhir_observation.get("performer", [{}])[0].get("display") if fhir_observation.get("performer") else None,
-            specimen=fhir_observation.get("specimen", {}).get("display") if fhir_observation.get("specimen") else None,
-            method=fhir_observation.get("method", {}).get("text") if fhir_observation.get("method") else None
+            notes=notes[0].get("text") if notes else None,
+            performer=performers[0].get("display") if performers else None,
+            specimen=specimen.get("display") if specimen else None,
+            method=method.get("text") if method else None
         )
-        
-        # Use the existing fhir_id from the FHIR resource
-        if "id" in fhir_observation:
-            observation.fhir_id = fhir_observation["id"]
-        
-        return observation
 
     @staticmethod
-    def report_to_fhir(report: TestReport) -> Dict[str, Any]:
-        """Convert TestReport model to FHIR DiagnosticReport resource"""
+    def report_to_fhir(report: TestReport, patient_fhir_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Convert TestReport model to FHIR DiagnosticReport resource. Pass the
+        patient's fhir_id when the caller already has it, so the patient
+        need not be loaded.
+        """
+        return FHIRMapper._report_resource(report, patient_fhir_id or report.patient.fhir_id)
+
+    @staticmethod
+    def report_row_to_fhir(row, patient_fhir_id: str) -> Dict[str, Any]:
+        """
+        Convert a test_reports table row to a FHIR DiagnosticReport resource
+        for the given patient, without hydrating ORM objects
+        """
+        return FHIRMapper._report_resource(row, patient_fhir_id)
+
+    @staticmethod
+    def _report_resource(report, patient_fhir_id: str) -> Dict[str, Any]:
+        """Build a FHIR DiagnosticReport resource from report column values and its patient"""
         fhir_report = {
             "resourceType": "DiagnosticReport",
-            "id": report.fhir_id,
-            "status": report.status,
-            "category": [
-                {
-                    "coding": [
-                        {
-                            "system": "http://terminology.hl7.org/CodeSystem/v2-0074",
-                            "code": report.category,
-                            "display": report.category.title()
-                        }
-                    ]
-                }
-            ],
-            "code": {
+            "id": report.fhir_id
+        }
+        if report.status is not None:
+            fhir_report["status"] = report.status
+        fhir_report["category"] = _coded_concepts(
+            "http://terminology.hl7.org/CodeSystem/v2-0074", report.category
+        )
+        fhir_report["code"] = _LAB_REPORT_CODE
+        fhir_report["subject"] = {
+            "reference": f"Patient/{patient_fhir_id}"
+        }
+        fhir_report["effectiveDateTime"] = report.effective_datetime.isoformat()
+        fhir_report["issued"] = report.issued.isoformat()
+        fhir_report["result"] = []  # This would be populated separately with references to observations
+        if report.conclusion is not None:
+            fhir_report["conclusion"] = report.conclusion
+        fhir_report["conclusionCode"] = [
+            {
                 "coding": [
                     {
-                        "system": "http://loinc.org",
-                        "code": "24323-8",
-                        "display": "Laboratory studies (set)"
+                        "system": "http://snomed.info/sct",
+                        "code": report.conclusion_code,
+                        "display": report.conclusion_code
                     }
-                ],
-                "text": "Laboratory Results"
-            },
-            "subject": {
-                "reference": f"Patient/{report.patient.fhir_id}"
-            },
-            "effectiveDateTime": report.effective_datetime.isoformat(),
-            "issued": report.issued.isoformat(),
-            "result": [],  # This would be populated separately with references to observations
-            "conclusion": report.conclusion,
-            "conclusionCode": [
-                {
-                    "coding": [
-                        {
-                            "system": "http://snomed.info/sct",
-                            "code": report.conclusion_code,
-                            "display": report.conclusion_code
-                        }
-                    ]
-                }
-            ] if report.conclusion_code else []
-        }
-        
-        # Remove None values
-        fhir_report = {k: v for k, v in fhir_report.items() if v is not None}
+                ]
+            }
+        ] if report.conclusion_code else []
         
         return fhir_report
 
     @staticmethod
     def fhir_to_report(fhir_report: Dict[str, Any], patient_id: int) -> TestReport:
         """Convert FHIR DiagnosticReport resource to TestReport model"""
-        from app.models import TestReport
-        
-        report = TestReport(
-            patient_id=patient_id,
-            effective_datetime=datetime.fromisoformat(fhir_report["effectiveDateTime"]),
-            status=fhir_report.get("status", "unknown"),
-            category=FHIRMapper._extract_diagnostic_category(fhir_report),
-            conclusion=fhir_report.get("conclusion"),
-            conclusion_code=fhir_report.get("conclusionCode", [{}])[0].get("coding", [{}])[0].get("code") if fhir_report.get("conclusionCode") else None
-        )
+        report = TestReport(patient_id=patient_id, **FHIRMapper._report_fields(fhir_report))
         
         # Use the existing fhir_id from the FHIR resource
         if "id" in fhir_report:
@@ -301,37 +411,53 @@ class FHIRMapper:
         
         return report
 
+    @staticmethod
+    def apply_report_update(report: TestReport, fhir_report: Dict[str, Any]) -> TestReport:
+        """Update a persistent TestReport in place from a FHIR DiagnosticReport resource, keeping its ids and patient"""
+        for field, value in FHIRMapper._report_fields(fhir_report).items():
+            setattr(report, field, value)
+        return report
+
+    @staticmethod
+    def _report_fields(fhir_report: Dict[str, Any]) -> Dict[str, Any]:
+        """Extract TestReport column values from a FHIR DiagnosticReport resource"""
+        return dict(
+            effective_datetime=parse_fhir_datetime(fhir_report["effectiveDateTime"]),
+            status=fhir_report.get("status", "unknown"),
+            category=FHIRMapper._extract_diagnostic_category(fhir_report),
+            conclusion=fhir_report.get("conclusion"),
+            conclusion_code=fhir_report.get("conclusionCode", [{}])[0].get("coding", [{}])[0].get("code") if fhir_report.get("conclusionCode") else None
+        )
+
     @staticmethod
     def create_bundle(resources: List[Dict[str, Any]], bundle_type: str = "collection") -> Dict[str, Any]:
         """Create a FHIR Bundle resource from a list of resources"""
-        bundle = {
+        return {
             "resourceType": "Bundle",
             "type": bundle_type,
-            "entry": []
+            "entry": [
+                {
+                    "fullUrl": f"{resource['resourceType']}/{resource['id']}",
+                    "resource": resource
+                }
+                for resource in resources if 'id' in resource
+            ]
+        }
+
+    @staticmethod
+    def bundle_entry(resource: Dict[str, Any]) -> Dict[str, Any]:
+        """Wrap a resource in a Bundle entry, or return None if it has no id"""
+        if 'id' not in resource:
+            return None
+        return {
+            "fullUrl": f"{resource['resourceType']}/{resource['id']}",
+            "resource": resource
         }
-        
-        for resource in resources:
-            bundle["entry"].append({
-                "fullUrl": f"{resource['resourceType']}/{resource['id']}" if 'id' in resource else None,
-                "resource": resource
-            })
-        
-        # Remove None values
-        bundle["entry"] = [entry for entry in bundle["entry"] if entry["fullUrl"] is not None]
-        
-        return bundle
 
     @staticmethod
     def _get_interpretation_display(interpretation_code: str) -> str:
         """Get display text for interpretation codes"""
-        interpretations = {
-            "H": "High",
-            "L": "Low",
-            "N": "Normal",
-            "A": "Abnormal",
-            "AA": "Critical abnormal"
-        }
-        return interpretations.get(interpretation_code, interpretation_code)
+        return _INTERPRETATION_DISPLAY.get(interpretation_code, interpretation_code)
 
     @staticmethod
     def _extract_category(fhir_observation: Dict[str, Any]) -> str:
@@ -352,17 +478,3 @@ class FHIRMapper:
             if codings:
                 return codings[0].get("code", "laboratory")
         return "laboratory"
-
-    @staticmethod
-    def _remove_none_values(obj):
-        """Recursively remove None values from dictionary and lists"""
-        if isinstance(obj, dict):
-            return {
-                key: FHIRMapper._remove_none_values(value)
-                for key, value in obj.items()
-                if value is not None
-            }
-        elif isinstance(obj, list):
-            return [FHIRMapper._remove_none_values(item) for item in obj if item is not None]
-        else:
-            return obj
\ No newline at end of file
@@ -0,0 +1,51 @@
+from collections import namedtuple
+from app import db
+from app.models import LOINCCode, UCUMUnit
+
+# Read-only snapshot of a code system row, attribute-compatible with the model
+CodeEntry = namedtuple('CodeEntry', ['code', 'display', 'system'])
+
+# Process-local copies of the (small, rarely changing) code tables, keyed by id
+LOINC_BY_ID = {}
+UCUM_BY_ID = {}
+
+
+def load_code_tables():
+    """Load all LOINC codes and UCUM units into the in-memory lookup tables"""
+    LOINC_BY_ID.update({
+        r.id: CodeEntry(r.code, r.display, r.system)
+        for r in db.session.execute(db.select(LOINCCode.id, LOINCCode.code, LOINCCode.display, LOINCCode.system))
+    })
+    UCUM_BY_ID.update({
+        r.id: CodeEntry(r.code, r.display, r.system)
+        for r in db.session.execute(db.select(UCUMUnit.id, UCUMUnit.code, UCUMUnit.display, UCUMUnit.system))
+    })
+
+
+def clear_code_tables():
+    """Empty the lookup tables, e.g. after the database was replaced; entries are reloaded on use"""
+    LOINC_BY_ID.clear()
+    UCUM_BY_ID.clear()
+
+
+def _lookup(cache, model, code_id):
+    if code_id is None:
+        return None
+    entry = cache.get(code_id)
+    if entry is None:
+        # Cache-aside: codes imported after start-up are fetched once on first use
+        row = db.session.get(model, code_id)
+        if row is None:
+            return None
+        entry = cache[code_id] = CodeEntry(row.code, row.display, row.system)
+    return entry
+
+
+def get_loinc(code_id):
+    """Get the cached LOINC code entry for an id, or None"""
+    return _lookup(LOINC_BY_ID, LOINCCode, code_id)
+
+
+def get_ucum(code_id):
+    """Get the cached UCUM unit entry for an id, or None"""
+    return _lookup(UCUM_BY_ID, UCUMUnit, code_id)
@@ -0,0 +1,43 @@
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from app import db
+
+
+def prewarm(app):
+    """
+    Run a few representative queries right after start-up so the first real
+    request finds the DB pages cached and the SQLAlchemy compiled-statement
+    cache populated. Failures (e.g. tables not created yet) are logged and
+    ignored; warm-up must never prevent the app from starting.
+    """
+    from app.models import Patient, Observation, Biomarker
+    
+    with app.app_context():
+        try:
+            db.session.execute(text('SELECT 1'))
+            db.session.get(Patient, 1)
+            Observation.query.filter_by(patient_id=1).limit(1).all()
+            db.session.query(Observation.id, Biomarker.name).join(Biomarker).limit(1).all()
+            
+            from app.services.terminology import load_code_tables
+            load_code_tables()
+            
+            if db.engine.dialect.name == 'postgresql':
+                _pg_prewarm(['patients', 'observations', 'test_reports'])
+        except SQLAlchemyError as e:
+            app.logger.warning(f"Warm-up queries failed: {str(e)}")
+        finally:
+            db.session.rollback()
+            db.session.remove()
+            # Don't keep pooled connections around for forked workers to share
+            db.engine.dispose()
+
+
+def _pg_prewarm(tables):
+    """Load tables into shared buffers; requires the pg_prewarm extension"""
+    for table in tables:
+        try:
+            db.session.execute(text('SELECT pg_prewarm(:table)'), {'table': table})
+        except SQLAlchemyError:
+            db.session.rollback()
+            return
@@ -1,6 +1,7 @@
 import os
 from datetime import timedelta
 from dotenv import load_dotenv
+from sqlalchemy.pool import StaticPool
 
 load_dotenv()
 
@@ -9,6 +10,16 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-secret-key-change-in-production'
     ENCRYPTION_KEY = os.environ.get('ENCRYPTION_KEY') or '32-character-encryption-key-here!'
+    # Argon2id cost of password hashes; stored hashes are upgraded to new
+    # settings on the user's next successful login
+    ARGON2_TIME_COST = int(os.environ.get('ARGON2_TIME_COST', 2))
+    ARGON2_MEMORY_COST = int(os.environ.get('ARGON2_MEMORY_COST', 64 * 1024))  # KiB
+    ARGON2_PARALLELISM = int(os.environ.get('ARGON2_PARALLELISM', 2))
+    
+    # Optional Redis shared by all workers: revoked JWTs (else the
+    # revoked_tokens table), cached responses and background AI jobs (both
+    # disabled without it)
+    REDIS_URL = os.environ.get('REDIS_URL')
     
     # Session settings
     PERMANENT_SESSION_LIFETIME = timedelta(seconds=int(os.environ.get('SESSION_LIFETIME', 3600)))
@@ -18,13 +29,47 @@ class Config:
     # Database
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///bloodwork.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Larger compiled-statement cache; echo='debug' in development surfaces
+    # statements logged as "[no key]" (not cacheable by SQLAlchemy)
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'query_cache_size': int(os.environ.get('SQLALCHEMY_QUERY_CACHE_SIZE', 1200)),
+        'echo': 'debug' if os.environ.get('FLASK_ENV') == 'development' else False
+    }
+    if SQLALCHEMY_DATABASE_URI.startswith('postgresql+psycopg2'):
+        # Batch executemany UPDATE/DELETE as well as INSERT (bulk import paths)
+        SQLALCHEMY_ENGINE_OPTIONS['executemany_mode'] = 'values_plus_batch'
+    # Serverless (Vercel): keep one connection alive across warm invocations
+    # and skip the per-checkout pre-ping round-trip
+    SERVERLESS = bool(os.environ.get('VERCEL'))
+    if SERVERLESS:
+        if SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+            SQLALCHEMY_ENGINE_OPTIONS.update({
+                'poolclass': StaticPool,
+                'connect_args': {'check_same_thread': False},
+                'pool_pre_ping': False
+            })
+        else:
+            SQLALCHEMY_ENGINE_OPTIONS.update({
+                'pool_size': 1,
+                'max_overflow': 0,
+                'pool_recycle': 280,
+                'pool_pre_ping': False
+            })
     DATABASE_BACKUP_ENABLED = os.environ.get('DATABASE_BACKUP_ENABLED', 'true').lower() == 'true'
     DATABASE_BACKUP_PATH = os.environ.get('DATABASE_BACKUP_PATH') or './backups'
     DATABASE_BACKUP_RETENTION_DAYS = int(os.environ.get('DATABASE_BACKUP_RETENTION_DAYS', 30))
     
     # File uploads
     FILE_UPLOAD_MAX_SIZE = int(os.environ.get('FILE_UPLOAD_MAX_SIZE', 20971520))  # 20MB default
+    # Reject oversized request bodies in Werkzeug before they are buffered
+    # (headroom for multipart boundaries and form fields)
+    MAX_CONTENT_LENGTH = FILE_UPLOAD_MAX_SIZE + 65536
     ALLOWED_FILE_TYPES = os.environ.get('ALLOWED_FILE_TYPES', 'pdf,jpg,jpeg,png').split(',')
+    # Let the front-end web server send document files: X_ACCEL_REDIRECT_PREFIX
+    # is an nginx `internal` location aliased to app/data/patients/ (e.g.
+    # /_protected/); USE_X_SENDFILE emits X-Sendfile for Apache/lighttpd
+    X_ACCEL_REDIRECT_PREFIX = os.environ.get('X_ACCEL_REDIRECT_PREFIX')
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', 'false').lower() == 'true'
     
     # AI settings
     AI_PROVIDER = os.environ.get('AI_PROVIDER', 'mock')  # local, openai, lmstudio, mock
@@ -39,6 +84,10 @@ class Config:
     DEBUG = os.environ.get('DEBUG', 'false').lower() == 'true'
     HOST = os.environ.get('HOST', '127.0.0.1')
     PORT = int(os.environ.get('PORT', 5000))
+    WARMUP = os.environ.get('WARMUP', 'false').lower() in ('1', 'true')
+    # Import every route module at start-up instead of on first request, so a
+    # preforking server (gunicorn --preload) shares them with its workers
+    PRELOAD_VIEWS = os.environ.get('PRELOAD_VIEWS', 'false').lower() in ('1', 'true')
     
     # Maximum number of patient profiles allowed
     MAX_PATIENT_PROFILES = 4
@@ -1,21 +1,15 @@
-from app import create_app
-from app.models import db
-from app.models import Patient, User
-from app.routes.auth import init_default_user
+from app import create_app, init_db
 from config import Config
 import os
 
 app = create_app()
 
-# Create database tables if they don't exist
-with app.app_context():
-    db.create_all()
-    init_default_user()
-
 
 if __name__ == '__main__':
+    # Create database tables if they don't exist (skipped once initialized)
+    init_db(app)
     app.run(
         host=Config.HOST,
         port=Config.PORT,
         debug=Config.DEBUG
-    )
\ No newline at end of file
+    )